@@ -0,0 +1,345 @@
+"""
+Command line interface for converting V-Log files.
+Heavy dependencies (pandas) are only imported by the commands which need them.
+"""
+
+
+from .messagetypes import MESSAGE_TYPE_DICT
+from .parsers import VLogParser
+from datetime import datetime
+import argparse
+import os
+import sys
+import time
+import ujson
+
+
+FORMATS = ['json', 'sqlite', 'parquet']
+
+# Sinks the parsers of a replay log to, 'none' only parses
+REPLAY_FORMATS = ['none', 'json', 'sqlite']
+
+# Default duration (s) of each replay when ramping up the speed
+RAMP_DURATION = 10
+
+# Message names by code, for reporting
+MESSAGE_NAMES = {code: name for name, codes in MESSAGE_TYPE_DICT.items() for code in codes}
+MESSAGE_NAMES[1] = 'tijdReferentie'
+
+
+class _StatusCounter(VLogParser):
+    """
+    Parser which counts logged statuses and notes the first and last timestamp.
+    """
+
+    def __init__(self, logged_types, cache_size=0):
+
+        super().__init__(logged_types, cache_size=cache_size)
+        self.num_statuses = 0
+        self.first_timestamp = None
+
+    def log_status(self, status):
+
+        self.num_statuses += 1
+        if self.first_timestamp is None:
+            self.first_timestamp = status['timestamp']
+
+
+def _read_lines(path):
+    """
+    Read the lines of a file, '-' reads from stdin.
+
+    Parameters
+    ----------
+    path : str
+        Path to file, or '-'.
+
+    Returns
+    ----------
+    lines : generator
+        Lines of the file, including empty lines.
+    """
+
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        yield from f
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def read_messages(paths, merge=False):
+    """
+    Read v-log messages (each on a new line) from files, in order.
+
+    Parameters
+    ----------
+    paths : list
+        Paths to files containing v-log messages, '-' reads from stdin.
+    merge : bool
+        If True the files are merged by time (see merge.merge_messages), rather than read one after the other.
+
+    Returns
+    ----------
+    messages : generator
+        Stripped, non-empty v-log messages.
+    """
+
+    if merge:
+        from .merge import merge_messages
+
+        yield from merge_messages([_read_lines(path) for path in paths])
+        return
+
+    for path in paths:
+        for m in _read_lines(path):
+            m = m.strip()  # Remove any whitespace from the messages
+            if m:
+                yield m
+
+
+def _format_time(timestamp):
+
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+def convert(args):
+    """
+    Convert v-log messages to statuses in the requested format.
+    Every format includes the final status, at the timestamp of the last message.
+    """
+
+    messages = read_messages(args.inputs, merge=args.merge)
+
+    if args.format == 'json':
+        from .parsers import VLogParserToJsonStream
+
+        f = sys.stdout if args.output == '-' else open(args.output, 'w')
+        try:
+            vlogger = VLogParserToJsonStream(f, logged_types=args.types, cache_size=args.cache_size)
+            for m in messages:
+                vlogger.parse_message(m)
+            vlogger.close()
+        finally:
+            if f is not sys.stdout:
+                f.close()
+
+    elif args.format == 'sqlite':
+        from .parsers import VLogParserToSqlite
+
+        vlogger = VLogParserToSqlite(args.output, intersection=args.intersection, changes_only=not args.full,
+                                     logged_types=args.types, cache_size=args.cache_size)
+        for m in messages:
+            vlogger.parse_message(m)
+        vlogger.close()
+
+    elif args.format == 'parquet':
+        from .converters import list_to_dataframe
+
+        df = list_to_dataframe(messages, logged_types=args.types, final_status=True)
+        df.columns = [str(c) for c in df.columns]
+        df.to_parquet(args.output)
+
+
+def index(args):
+    """
+    List the time references (type 01 messages) of each input, with their line numbers.
+    """
+
+    for path in args.inputs:
+        vlogger = VLogParser()
+        # Number the lines of the file as they are, including empty lines
+        for line, m in enumerate(_read_lines(path), 1):
+            m = m.strip()
+            if m[:2] == '01':
+                vlogger.parse_message(m)
+                sys.stdout.write("{}\t{}\t{}\n".format(path, line, _format_time(vlogger.status['tijdReferentie'])))
+
+
+def stats(args):
+    """
+    Report message counts per type, number of statuses, time span and parsing speed.
+    """
+
+    vlogger = _StatusCounter(args.types, cache_size=args.cache_size)
+    counts = {}
+    num_messages = 0
+
+    start = time.perf_counter()
+    for m in read_messages(args.inputs, merge=args.merge):
+        name = MESSAGE_NAMES.get(int(m[:2], 16), m[:2])
+        counts[name] = counts.get(name, 0) + 1
+        num_messages += 1
+        vlogger.parse_message(m)
+    duration = time.perf_counter() - start
+
+    report = {'messages': num_messages,
+              'messageTypes': counts,
+              'statuses': vlogger.num_statuses,
+              'start': _format_time(vlogger.first_timestamp),
+              'end': _format_time(vlogger.status['timestamp']),
+              'messagesPerSecond': round(num_messages / duration) if duration else None,
+              'cache': vlogger.cache_info()}
+    sys.stdout.write(ujson.dumps(report, indent=2) + "\n")
+
+
+def replay(args):
+    """
+    Replay v-log files (one per intersection) with their original timing and report latency and throughput.
+    """
+
+    from .replay import ParserTarget, Replayer, StreamTarget, TcpTarget, find_max_throughput
+    import itertools
+    import tempfile
+
+    # Name intersections by their file, numbering repeated files
+    sources = {}
+    for i, path in enumerate(args.inputs):
+        name = path if path not in sources else '{}#{}'.format(path, i)
+        sources[name] = list(read_messages([path]))
+    speed = args.speed if args.speed > 0 else None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        runs = itertools.count()
+        files = []
+
+        def make_parsers(names):
+            # A new sink per intersection for every run, writing to the temporary directory
+            run = next(runs)
+            parsers = {}
+            for i, name in enumerate(names):
+                path = os.path.join(tmp_dir, '{}-{}.{}'.format(run, i, args.format))
+                if args.format == 'json':
+                    from .parsers import VLogParserToJsonStream
+
+                    files.append(open(path, 'w'))
+                    parsers[name] = VLogParserToJsonStream(files[-1], logged_types=args.types,
+                                                           cache_size=args.cache_size)
+                elif args.format == 'sqlite':
+                    from .parsers import VLogParserToSqlite
+
+                    parsers[name] = VLogParserToSqlite(path, logged_types=args.types, cache_size=args.cache_size)
+                else:
+                    parsers[name] = VLogParser(logged_types=args.types, cache_size=args.cache_size)
+            return parsers
+
+        try:
+            if args.ramp:
+                max_duration = RAMP_DURATION if args.duration is None else args.duration
+                report = find_max_throughput(sources, make_parsers, speeds=args.ramp, max_latency=args.max_latency,
+                                             max_duration=max_duration)
+            else:
+                if args.tcp:
+                    host, port = args.tcp.rsplit(':', 1)
+                    target = TcpTarget((host, int(port)), list(sources.keys()))
+                elif args.stdout:
+                    target = StreamTarget({name: sys.stdout for name in sources})
+                else:
+                    target = ParserTarget(make_parsers(list(sources.keys())))
+
+                report = Replayer(sources, target, speed=speed).run(max_duration=args.duration)
+                target.close()
+                if isinstance(target, ParserTarget):
+                    report.update(target.report())
+        finally:
+            for f in files:
+                f.close()
+
+    # Keep stdout for the messages when replaying to it
+    out = sys.stderr if args.stdout else sys.stdout
+    out.write(ujson.dumps(report, indent=2) + "\n")
+
+
+def _logged_types(value):
+
+    return [] if value == 'all' else value.split(',')
+
+
+def main(argv=None):
+    """
+    Entry point of the pyvlog command.
+
+    Parameters
+    ----------
+    argv : list
+        Command line arguments, if None sys.argv is used.
+    """
+
+    parser = argparse.ArgumentParser(prog='pyvlog', description="Convert V-Log traffic control data.")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    merge_help = "merge the inputs (one intersection) by time and drop duplicates, rather than concatenating"
+    cache_help = "number of decoded message payloads to cache (default: 0, no cache)"
+    types_help = "comma separated message types to log, or 'all' (default: detectie,externeSignaalgroep)"
+
+    convert_parser = commands.add_parser('convert', help="convert v-log messages to statuses, including the final "
+                                                         "status at the timestamp of the last message")
+    convert_parser.add_argument('inputs', nargs='*', default=['-'], help="v-log files, '-' or none reads stdin")
+    convert_parser.add_argument('-f', '--format', choices=FORMATS, default='json', help="output format")
+    convert_parser.add_argument('-o', '--output', default='-', help="output file, '-' writes stdout (json only)")
+    convert_parser.add_argument('-t', '--types', type=_logged_types, default=['detectie', 'externeSignaalgroep'],
+                                help=types_help)
+    convert_parser.add_argument('--intersection', default=None, help="intersection name (sqlite only)")
+    convert_parser.add_argument('--full', action='store_true',
+                                help="store full statuses rather than only changes (sqlite only)")
+    convert_parser.add_argument('--cache-size', type=int, default=0, help=cache_help)
+    convert_parser.add_argument('--merge', action='store_true', help=merge_help)
+    convert_parser.set_defaults(function=convert)
+
+    index_parser = commands.add_parser('index', help="list the time references of v-log files")
+    index_parser.add_argument('inputs', nargs='*', default=['-'], help="v-log files, '-' or none reads stdin")
+    index_parser.set_defaults(function=index)
+
+    stats_parser = commands.add_parser('stats', help="report statistics of v-log messages")
+    stats_parser.add_argument('inputs', nargs='*', default=['-'], help="v-log files, '-' or none reads stdin")
+    stats_parser.add_argument('-t', '--types', type=_logged_types, default=['detectie', 'externeSignaalgroep'],
+                              help=types_help)
+    stats_parser.add_argument('--cache-size', type=int, default=0, help=cache_help)
+    stats_parser.add_argument('--merge', action='store_true', help=merge_help)
+    stats_parser.set_defaults(function=stats)
+
+    replay_parser = commands.add_parser('replay', help="replay v-log files with their original timing")
+    replay_parser.add_argument('inputs', nargs='+', help="v-log files, one per intersection")
+    replay_parser.add_argument('-s', '--speed', type=float, default=1.0,
+                               help="speed-up factor of the original timing, 0 replays as fast as possible")
+    replay_parser.add_argument('--tcp', default=None, help="send to HOST:PORT, one connection per intersection")
+    replay_parser.add_argument('--stdout', action='store_true', help="write the messages to stdout (one input only)")
+    replay_parser.add_argument('-f', '--format', choices=REPLAY_FORMATS, default='none',
+                               help="sink the parsers log statuses to (in a temporary directory), "
+                                    "so the latency includes logging (default: none, parsing only)")
+    replay_parser.add_argument('--ramp', type=lambda value: [float(v) for v in value.split(',')], default=None,
+                               help="comma separated speeds to replay into parsers, to find the sustained rate")
+    replay_parser.add_argument('--max-latency', type=float, default=0.1,
+                               help="latency (s) above which parsers are falling behind (default: 0.1)")
+    replay_parser.add_argument('--duration', type=float, default=None,
+                               help="maximum duration (s) of each replay (default: no limit, {} with --ramp)".format(
+                                   RAMP_DURATION))
+    replay_parser.add_argument('-t', '--types', type=_logged_types, default=['detectie', 'externeSignaalgroep'],
+                               help=types_help)
+    replay_parser.add_argument('--cache-size', type=int, default=0, help=cache_help)
+    replay_parser.set_defaults(function=replay)
+
+    args = parser.parse_args(argv)
+    if args.command == 'convert' and args.format != 'json':
+        if args.output == '-':
+            parser.error("{} output needs a file, use -o".format(args.format))
+        if args.format == 'parquet':
+            from importlib.util import find_spec
+
+            if find_spec('pyarrow') is None and find_spec('fastparquet') is None:
+                parser.error("parquet output needs pyarrow or fastparquet, install with: pip install pyvlog[parquet]")
+    if args.command == 'replay' and args.stdout and len(args.inputs) > 1:
+        parser.error("--stdout replays a single input, use --tcp for several intersections")
+
+    try:
+        args.function(args)
+    except BrokenPipeError:
+        # Output closed early (e.g. piped to head), silence the error on interpreter exit
+        sys.stdout = open(os.devnull, 'w')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""
+Compact device statuses, with the fields of each device packed into one integer held in a typed array.
+
+The packed value of a device is its encoded value from the v-log message (see messagetypes.PACKED_FIELDS),
+so decoding does not allocate a dictionary per device.
+"""
+
+
+from .messagetypes import PACKED_FIELDS
+from .utils import _num_status_devices, _num_update_devices
+from array import array
+
+
+# Packed value of a device which is not known
+MISSING = 0xFFFF
+
+
+def decode_payload_packed(message_type, payload):
+    """
+    Decode the packed device values of a status or update message, see utils.decode_payload.
+
+    Parameters
+    ----------
+    message_type : int
+        Message code (a device type of messagetypes.MESSAGE_TYPE_DICT, not 1 or 4).
+    payload : str
+        Message after the deltaTijd (from the sixth character on).
+
+    Returns
+    ----------
+    values : tuple
+        Pairs of (device index, packed value), in message order.
+    """
+
+    values = []
+
+    if message_type in [5, 13, 17, 19, 23]:
+        # Detection / external phase / desired program / actual program / thermometer status
+        num_sensors = _num_status_devices(payload, data_size=1)
+        mask = 0x3 if message_type == 23 else 0xFF
+        for i in range(0, num_sensors):
+            values.append((i, int(payload[3 + i], 16) & mask))
+
+    elif message_type == 6:
+        # Detection update
+        num_sensors = _num_update_devices(payload, data_size=4)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 4:3 + i * 4], 16), int(payload[4 + i * 4], 16)))
+
+    elif message_type in [7, 11, 15]:
+        # Other input / output (GUS, WUS) status, one bit per device
+        num_sensors = _num_status_devices(payload, data_size=0.25)
+        for i in range(0, num_sensors):
+            values.append((i, (int(payload[3 + i // 4], 16) >> (3 - i % 4)) & 1))
+
+    elif message_type in [8, 12, 16]:
+        # Other input / output (GUS, WUS) update, index in the upper seven bits
+        num_sensors = _num_update_devices(payload, data_size=2)
+        for i in range(0, num_sensors):
+            value = int(payload[1 + i * 2:3 + i * 2], 16)
+            values.append((value >> 1, value & 1))
+
+    elif message_type == 9:
+        # Internal phase status
+        num_sensors = _num_status_devices(payload, data_size=3)
+        for i in range(0, num_sensors):
+            values.append((i, int(payload[3 + i * 3:6 + i * 3], 16) & 0x7FF))
+
+    elif message_type == 10:
+        # Internal phase update
+        num_sensors = _num_update_devices(payload, data_size=6)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 6:3 + i * 6], 16), int(payload[4 + i * 6:7 + i * 6], 16) & 0x7FF))
+
+    elif message_type == 14:
+        # External phase update
+        num_sensors = _num_update_devices(payload, data_size=4)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 4:3 + i * 4], 16), int(payload[3 + i * 4:5 + i * 4], 16)))
+
+    elif message_type in [18, 20, 24]:
+        # Desired / actual program / thermometer update
+        num_sensors = _num_update_devices(payload, data_size=2)
+        mask = 0x3 if message_type == 24 else 0xF
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 2], 16), int(payload[2 + i * 2], 16) & mask))
+
+    elif message_type == 32:
+        # Instruction variable update
+        num_sensors = _num_update_devices(payload, data_size=4)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 4:3 + i * 4], 16), int(payload[3 + i * 4:5 + i * 4], 16) & 0x1F))
+
+    elif message_type == 34:
+        # OV/hulpdienst update
+        num_sensors = _num_update_devices(payload, data_size=6)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 6:3 + i * 6], 16), int(payload[3 + i * 6:7 + i * 6], 16) & 0x3FF))
+
+    return tuple(values)
+
+
+def unpack(fields, packed):
+    """
+    Unpack the fields of a device.
+
+    Parameters
+    ----------
+    fields : list
+        Tuples of (field, bit shift, bit width), see messagetypes.PACKED_FIELDS.
+    packed : int
+        Packed value of the device.
+
+    Returns
+    ----------
+    value : dict or int
+        Dictionary of field values, or the value itself for devices with a single 'state' field.
+    """
+
+    if fields[0][0] == 'state':
+        return packed
+
+    return {field: (packed >> shift) & ((1 << width) - 1) for field, shift, width in fields}
+
+
+def pack(fields, value):
+    """
+    Pack the fields of a device, the inverse of unpack.
+
+    Parameters
+    ----------
+    fields : list
+        Tuples of (field, bit shift, bit width), see messagetypes.PACKED_FIELDS.
+    value : dict or int
+        Dictionary of field values, or the value itself for devices with a single 'state' field.
+
+    Returns
+    ----------
+    packed : int
+        Packed value of the device.
+    """
+
+    if fields[0][0] == 'state':
+        return value
+
+    packed = 0
+    for field, shift, width in fields:
+        packed |= value[field] << shift
+
+    return packed
+
+
+class DeviceView(object):
+    """
+    Read-only view of the fields of a packed device.
+
+    Parameters
+    ----------
+    fields : list
+        Tuples of (field, bit shift, bit width), see messagetypes.PACKED_FIELDS.
+    packed : int
+        Packed value of the device.
+    """
+
+    __slots__ = ['_fields', 'packed']
+
+    def __init__(self, fields, packed):
+
+        self._fields = fields
+        self.packed = packed
+
+    def __getitem__(self, key):
+
+        for field, shift, width in self._fields:
+            if field == key:
+                return (self.packed >> shift) & ((1 << width) - 1)
+        raise KeyError(key)
+
+    def keys(self):
+
+        return [field for field, shift, width in self._fields]
+
+    def to_dict(self):
+        """
+        Convert the device to a dictionary of field values.
+
+        Returns
+        ----------
+        value : dict
+            Dictionary of field values.
+        """
+
+        return unpack(self._fields, self.packed)
+
+    def __eq__(self, other):
+
+        return self.to_dict() == (other.to_dict() if isinstance(other, DeviceView) else other)
+
+    def __repr__(self):
+
+        return repr(self.to_dict())
+
+
+class CompactDevices(object):
+    """
+    Packed values of all devices of a message type, indexed by device index.
+    Behaves as a dictionary of device index to a read-only DeviceView (or the value, for single 'state' devices).
+
+    Parameters
+    ----------
+    key : str
+        Message type (key of messagetypes.PACKED_FIELDS).
+    """
+
+    __slots__ = ['key', 'fields', 'packed']
+
+    def __init__(self, key):
+
+        self.key = key
+        self.fields = PACKED_FIELDS[key]
+        self.packed = array('H')  # Packed value per device index, MISSING if unknown
+
+    def __contains__(self, index):
+
+        return 0 <= index < len(self.packed) and self.packed[index] != MISSING
+
+    def __setitem__(self, index, packed):
+
+        if index >= len(self.packed):
+            self.packed.extend([MISSING] * (index + 1 - len(self.packed)))
+        self.packed[index] = packed
+
+    def __getitem__(self, index):
+
+        if index not in self:
+            raise KeyError(index)
+        if self.fields[0][0] == 'state':
+            return self.packed[index]
+
+        return DeviceView(self.fields, self.packed[index])
+
+    def __iter__(self):
+
+        return (index for index, packed in enumerate(self.packed) if packed != MISSING)
+
+    def __len__(self):
+
+        return len(self.packed) - self.packed.count(MISSING)
+
+    def keys(self):
+
+        return list(self)
+
+    def values(self):
+
+        return [self[index] for index in self]
+
+    def items(self):
+
+        return [(index, self[index]) for index in self]
+
+    def freeze(self):
+        """
+        Read-only copy of the devices, e.g. for passing to other threads.
+
+        Returns
+        ----------
+        devices : CompactDevices
+            Copy whose packed values are a tuple.
+        """
+
+        frozen = CompactDevices(self.key)
+        frozen.packed = tuple(self.packed)
+
+        return frozen
+
+    def to_dict(self):
+        """
+        Convert the devices to a dictionary, in the format of VLogParser.status.
+
+        Returns
+        ----------
+        devices : dict
+            Dictionary of device index to value.
+        """
+
+        return {index: unpack(self.fields, packed) for index, packed in enumerate(self.packed)
+                if packed != MISSING}
+
+
+def status_to_dict(status):
+    """
+    Convert a status with compact devices to the format of VLogParser.status.
+
+    Parameters
+    ----------
+    status : dict
+        V-log status, with CompactDevices per message type.
+
+    Returns
+    ----------
+    status : dict
+        V-log status, with dictionaries per message type.
+    """
+
+    return {key: value.to_dict() if isinstance(value, CompactDevices) else value for key, value in status.items()}
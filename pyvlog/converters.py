@@ -5,7 +5,8 @@ Functions for converting V-Log data into statuses.
 
 from .parsers import *
 from .utils import flatten
-import pandas as pd
+
+# pandas and numpy are imported by the functions which need them, so conversions without dataframes start quickly
 
 
 def list_to_list(messages, logged_types=['detectie', 'externeSignaalgroep']):
@@ -56,7 +57,7 @@ def list_to_json(messages, path_to_json, logged_types=['detectie', 'externeSigna
         vlogger.parse_message(m.strip())  # Remove any whitespace from the messages
 
 
-def list_to_dataframe(messages, logged_types=['detectie', 'externeSignaalgroep']):
+def list_to_dataframe(messages, logged_types=['detectie', 'externeSignaalgroep'], final_status=False):
     """
     Convert a list of v-log messages to a dataframe of statuses.
 
@@ -67,6 +68,9 @@ def list_to_dataframe(messages, logged_types=['detectie', 'externeSignaalgroep']
     logged_types : list
         Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
         If empty list all types are logged.
+    final_status : bool
+        If True the status at the end of the messages is included too, which is otherwise only logged
+        once a message with a later timestamp arrives.
 
     Returns
     ----------
@@ -79,6 +83,10 @@ def list_to_dataframe(messages, logged_types=['detectie', 'externeSignaalgroep']
 
     for m in messages:
         vlogger.parse_message(m.strip())  # Remove any whitespace from the messages
+    if final_status and vlogger.status['timestamp']:
+        vlogger.log_status(vlogger.status, status_list)
+
+    import pandas as pd
 
     # Flatten statuses
     status_list = [flatten(d) for d in status_list]
@@ -178,6 +186,10 @@ def file_to_dataframe(path_to_vlg, logged_types=['detectie', 'externeSignaalgroe
 
     for m in messages:
         vlogger.parse_message(m.strip())  # Remove any whitespace from the messages
+    if final_status and vlogger.status['timestamp']:
+        vlogger.log_status(vlogger.status, status_list)
+
+    import pandas as pd
 
     # Flatten statuses
     status_list = [flatten(d) for d in status_list]
@@ -189,3 +201,192 @@ def file_to_dataframe(path_to_vlg, logged_types=['detectie', 'externeSignaalgroe
     df["deltaTijd"] = pd.to_timedelta(df["deltaTijd"] * 1000000000)
 
     return df
+
+
+def changes_to_intervals(changes, end_time):
+    """
+    Convert recorded device changes to tables of constant state intervals.
+    Consecutive values of each device are run-length encoded, so the full status per timestamp is never built.
+
+    Parameters
+    ----------
+    changes : dict
+        Device changes, as recorded by parsers.VLogParserToChanges.
+    end_time : float
+        Timestamp at which the last interval of each device ends.
+
+    Returns
+    ----------
+    intervals : dict
+        Dataframe of intervals per message type, with columns 'index', the state ('state' or one column per field),
+        'start' and 'end'.
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    intervals = {}
+    for key, change in changes.items():
+        fields = change.get('fields', ['state'])
+        columns = ['index'] + fields + ['start', 'end']
+
+        # Values decoded before the first time reference hold from the first timestamp
+        timestamps = np.array(change['timestamp'], dtype=float)
+        known = ~np.isnan(timestamps)
+        if not known.any():
+            intervals[key] = pd.DataFrame(columns=columns)
+            continue
+        timestamps[~known] = timestamps[known][0]
+        indices = np.array(change['index'], dtype=np.int64)
+        values = np.array(change['value'], dtype=np.int64).reshape(len(indices), len(fields))
+
+        # Sort by device then time, lexsort is stable so the order of writes is kept
+        order = np.lexsort((timestamps, indices))
+        timestamps, indices, values = timestamps[order], indices[order], values[order]
+
+        # Keep only the last value written to each device at each timestamp
+        last = np.ones(len(indices), dtype=bool)
+        last[:-1] = (indices[1:] != indices[:-1]) | (timestamps[1:] != timestamps[:-1])
+        timestamps, indices, values = timestamps[last], indices[last], values[last]
+
+        # A run starts at the first value of a device or wherever its state changes
+        new_run = np.ones(len(indices), dtype=bool)
+        new_run[1:] = (indices[1:] != indices[:-1]) | (values[1:] != values[:-1]).any(axis=1)
+        starts, indices, values = timestamps[new_run], indices[new_run], values[new_run]
+
+        # A run ends where the next run of the same device starts
+        ends = np.full(len(starts), end_time, dtype=float)
+        same_device = indices[1:] == indices[:-1]
+        ends[:-1][same_device] = starts[1:][same_device]
+
+        df = pd.DataFrame(values, columns=fields)
+        df.insert(0, 'index', indices)
+        df['start'] = pd.to_datetime(starts * 1000000000)
+        df['end'] = pd.to_datetime(ends * 1000000000)
+        intervals[key] = df
+
+    return intervals
+
+
+def list_to_intervals(messages, logged_types=['detectie', 'externeSignaalgroep']):
+    """
+    Convert a list of v-log messages to tables of constant state intervals per device.
+
+    Parameters
+    ----------
+    messages : list
+        List of v-log messages.
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+
+    Returns
+    ----------
+    intervals : dict
+        Dataframe of intervals per message type, see changes_to_intervals.
+    """
+
+    changes = {}
+    vlogger = VLogParserToChanges(changes, logged_types=logged_types)
+
+    for m in messages:
+        vlogger.parse_message(m.strip())  # Remove any whitespace from the messages
+
+    return changes_to_intervals(changes, vlogger.status['timestamp'])
+
+
+def file_to_intervals(path_to_vlg, logged_types=['detectie', 'externeSignaalgroep']):
+    """
+    Convert a file of v-log messages (each on a new line) to tables of constant state intervals per device.
+
+    Parameters
+    ----------
+    path_to_vlg : str
+       Path to file containing vlog messages.
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+
+    Returns
+    ----------
+    intervals : dict
+        Dataframe of intervals per message type, see changes_to_intervals.
+    """
+
+    # Load the set of messages
+    with open(path_to_vlg, "rb") as f:
+        messages = f.readlines()
+    messages = [m.decode("utf-8").strip() for m in messages]
+
+    changes = {}
+    vlogger = VLogParserToChanges(changes, logged_types=logged_types)
+
+    for m in messages:
+        vlogger.parse_message(m.strip())  # Remove any whitespace from the messages
+
+    return changes_to_intervals(changes, vlogger.status['timestamp'])
+
+
+def list_to_sqlite(messages, path_to_db, intersection=None, changes_only=True,
+                   logged_types=['detectie', 'externeSignaalgroep']):
+    """
+    Convert a list of v-log messages to an SQLite database of statuses.
+
+    Parameters
+    ----------
+    messages : list
+        List of v-log messages.
+    path_to_db : str
+       Path to SQLite database to write to.
+    intersection : str
+        Name of the intersection. If None the 'VRI id' of vlogInformatie is used, if logged.
+    changes_only : bool
+        If True only store device values that differ from the previously stored value,
+        otherwise store the full status at every timestamp.
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+    """
+
+    vlogger = VLogParserToSqlite(path_to_db, intersection=intersection, changes_only=changes_only,
+                                 logged_types=logged_types)
+
+    for m in messages:
+        vlogger.parse_message(m.strip())  # Remove any whitespace from the messages
+
+    vlogger.close()
+
+
+def file_to_sqlite(path_to_vlg, path_to_db, intersection=None, changes_only=True,
+                   logged_types=['detectie', 'externeSignaalgroep']):
+    """
+    Convert a file of v-log messages (each on a new line) to an SQLite database of statuses.
+
+    Parameters
+    ----------
+    path_to_vlg : str
+       Path to file containing vlog messages.
+    path_to_db : str
+       Path to SQLite database to write to.
+    intersection : str
+        Name of the intersection. If None the 'VRI id' of vlogInformatie is used, if logged.
+    changes_only : bool
+        If True only store device values that differ from the previously stored value,
+        otherwise store the full status at every timestamp.
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+    """
+
+    # Load the set of messages
+    with open(path_to_vlg, "rb") as f:
+        messages = f.readlines()
+    messages = [m.decode("utf-8").strip() for m in messages]
+
+    vlogger = VLogParserToSqlite(path_to_db, intersection=intersection, changes_only=changes_only,
+                                 logged_types=logged_types)
+
+    for m in messages:
+        vlogger.parse_message(m.strip())  # Remove any whitespace from the messages
+
+    vlogger.close()
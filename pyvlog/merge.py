@@ -0,0 +1,177 @@
+"""
+Functions for merging v-log messages from multiple sources of the same intersection.
+"""
+
+
+from .messagetypes import MESSAGE_TYPE_DICT
+from .utils import parse_time_reference
+from collections import Counter
+import heapq
+import itertools
+
+
+# Message codes which carry a deltaTijd relative to the time reference
+DELTA_TIME_TYPES = {code for name, codes in MESSAGE_TYPE_DICT.items() if name != 'vlogInformatie' for code in codes}
+
+# Most messages held in memory per source while looking for its first time reference
+MAX_UNTIMED_MESSAGES = 100000
+
+
+def timed_messages(messages):
+    """
+    Reconstruct the absolute time of each v-log message from the time reference and deltaTijd.
+    Messages without a deltaTijd take the time of the previous message,
+    messages before the first time reference take the earliest possible time.
+
+    Parameters
+    ----------
+    messages : iterable
+        V-log messages.
+
+    Returns
+    ----------
+    timed_messages : generator
+        Tuples of (time, message, reference), with time in tenths of a second
+        and reference the time reference message the time is relative to.
+    """
+
+    reference = None
+    reference_time = None
+    time = float('-inf')
+
+    for m in messages:
+        m = m.strip()  # Remove any whitespace from the messages
+        if not m:
+            continue
+
+        message_type = int(m[:2], 16)
+        if message_type == 1:
+            reference = m
+            reference_time = round(parse_time_reference(m) * 10)
+            time = reference_time
+        elif message_type in DELTA_TIME_TYPES and reference_time is not None:
+            time = reference_time + int(m[2:5], 16)
+
+        yield time, m, reference
+
+
+def _tag_source(source, i):
+    """
+    Add the index of the source to its timed messages, so that sources are merged in a fixed order.
+    """
+
+    for time, m, reference in timed_messages(source):
+        yield time, i, m, reference
+
+
+def _split_head(timed_source, i):
+    """
+    Split the timed messages of a source into the messages before its first time reference and the rest.
+
+    Parameters
+    ----------
+    timed_source : iterator
+        Timed messages of a source, see _tag_source.
+    i : int
+        Index of the source, for error messages.
+
+    Returns
+    ----------
+    head : list
+        Timed messages before the first time reference, at most MAX_UNTIMED_MESSAGES.
+    first_time : float
+        Time of the first time reference.
+    rest : iterator
+        Timed messages from the first time reference on.
+    """
+
+    head = []
+    for item in timed_source:
+        if item[0] != float('-inf'):
+            return head, item[0], itertools.chain([item], timed_source)
+        head.append(item)
+        assert len(head) <= MAX_UNTIMED_MESSAGES, \
+            "Source {} has no time reference in its first {} messages".format(i, MAX_UNTIMED_MESSAGES)
+
+    assert False, "Source {} has no time reference, so it cannot be merged by time".format(i)
+
+
+def merge_messages(sources):
+    """
+    Merge v-log messages from several sources of one intersection into a single stream ordered by time.
+    Each source should itself be ordered by time. Exact duplicates (e.g. from overlapping captures) are dropped
+    and time reference messages are inserted where needed, so the stream can be fed to a single parser.
+    Messages before the first time reference of a source cannot be timed, so they are only kept for the source
+    with the earliest time reference (where they start the stream) and dropped for the others,
+    which should overlap another source there. Every source needs a time reference
+    within its first MAX_UNTIMED_MESSAGES messages.
+    Only one message per source (plus the messages at the current time) is held in memory,
+    besides the messages before each first time reference.
+
+    Parameters
+    ----------
+    sources : list
+        Iterables of v-log messages, e.g. open files.
+
+    Returns
+    ----------
+    messages : generator
+        Merged v-log messages.
+    """
+
+    heads = [_split_head(_tag_source(source, i), i) for i, source in enumerate(sources)]
+    earliest = min(range(len(heads)), key=lambda i: heads[i][1], default=None)
+    timed_sources = [itertools.chain(head, rest) if i == earliest else rest
+                     for i, (head, first_time, rest) in enumerate(heads)]
+
+    current_time = None
+    current_source = None
+    emitted = Counter()  # Messages at the current time emitted by previous sources
+    own = Counter()  # Messages at the current time seen from the current source
+    last_reference = None
+
+    for time, i, m, reference in heapq.merge(*timed_sources, key=lambda item: item[:2]):
+        if time != current_time:
+            current_time, current_source = time, i
+            emitted, own = Counter(), Counter()
+        elif i != current_source:
+            # Overlapping sources repeat messages, so keep the union (not the sum) of what they contain
+            current_source = i
+            emitted |= own
+            own = Counter()
+
+        own[m] += 1
+        if own[m] <= emitted[m]:
+            continue
+
+        # Make sure the message is relative to the right time reference
+        if reference is not None and reference != last_reference:
+            if m != reference:
+                yield reference
+            last_reference = reference
+
+        yield m
+
+
+def merge_files(paths):
+    """
+    Merge v-log files (each message on a new line) of one intersection into a single stream ordered by time.
+    See merge_messages.
+
+    Parameters
+    ----------
+    paths : list
+        Paths to files containing v-log messages.
+
+    Returns
+    ----------
+    messages : generator
+        Merged v-log messages.
+    """
+
+    files = [open(path, 'r', encoding='utf-8') for path in paths]
+    try:
+        yield from merge_messages(files)
+    finally:
+        for f in files:
+            f.close()
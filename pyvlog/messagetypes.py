@@ -14,4 +14,36 @@ MESSAGE_TYPE_DICT = {
     'OVHulpdienstInformatie': [34]
 }
 # The below message types only exist for the timestamp of their creation
-WIPED_MESSAGES = ['instructieVariabelen', 'OVHulpdienstInformatie']
\ No newline at end of file
+WIPED_MESSAGES = ['instructieVariabelen', 'OVHulpdienstInformatie']
+
+# Fields of each device by message type, types with a single value per device have the field 'state'
+DEVICE_FIELDS = {
+    'detectie': ['OG-BG-FL', 'storing', 'bezet'],
+    'overigeIngangen': ['state'],
+    'interneFaseCyclus': ['SR', 'MR', 'BR', 'AR', 'PR', 'A', 'CG'],
+    'overigeUitgangenGUS': ['state'],
+    'externeSignaalgroep': ['state'],
+    'overigeUitgangenWUS': ['state'],
+    'gewensteProgrammaStatus': ['state'],
+    'werkelijkeProgrammaStatus': ['state'],
+    'thermometer': ['MVG', 'RNA'],
+    'instructieVariabelen': ['TVG/MG', 'YV/VVAG', 'MK/H1H2', 'Z/AFK', 'FM/VMG'],
+    'OVHulpdienstInformatie': list(range(10))
+}
+
+# Packed layout of each device by message type, as (field, bit shift, bit width) of the device's encoded value
+PACKED_FIELDS = {
+    'detectie': [('OG-BG-FL', 2, 2), ('storing', 1, 1), ('bezet', 0, 1)],
+    'overigeIngangen': [('state', 0, 1)],
+    'interneFaseCyclus': [('SR', 10, 1), ('MR', 9, 1), ('BR', 8, 1), ('AR', 7, 1), ('PR', 6, 1), ('A', 5, 1),
+                          ('CG', 0, 5)],
+    'overigeUitgangenGUS': [('state', 0, 1)],
+    'externeSignaalgroep': [('state', 0, 8)],
+    'overigeUitgangenWUS': [('state', 0, 1)],
+    'gewensteProgrammaStatus': [('state', 0, 4)],
+    'werkelijkeProgrammaStatus': [('state', 0, 4)],
+    'thermometer': [('MVG', 0, 1), ('RNA', 1, 1)],
+    'instructieVariabelen': [('TVG/MG', 4, 1), ('YV/VVAG', 3, 1), ('MK/H1H2', 2, 1), ('Z/AFK', 1, 1),
+                             ('FM/VMG', 0, 1)],
+    'OVHulpdienstInformatie': [(i, i, 1) for i in range(10)]
+}
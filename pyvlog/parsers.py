@@ -5,10 +5,24 @@ Classes for parsing V-Log messages and logging statuses.
 
 from .messagetypes import *
 from .utils import *
-from datetime import datetime, timedelta
+from . import sqlite
+from .compact import CompactDevices, decode_payload_packed, pack, status_to_dict
+from .compact import MISSING as MISSING_PACKED
+from array import array
+from types import MappingProxyType
+import functools
 import ujson
 
 
+def _decode_frozen(decoder, message_type, payload):
+    """
+    Decode the device values of a message payload with device dictionaries made read-only, so they can be cached.
+    """
+
+    return tuple((index, MappingProxyType(value) if isinstance(value, dict) else value)
+                 for index, value in decoder(message_type, payload))
+
+
 class VLogParser(object):
     """
     Base class for parsing v-log messages.
@@ -19,9 +33,12 @@ class VLogParser(object):
     logged_types : list
         Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
         If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to keep in a least recently used cache, so that repeated payloads
+        are not decoded again. If 0 nothing is cached.
     """
 
-    def __init__(self, logged_types=['detectie', 'externeSignaalgroep'], **kwargs):
+    def __init__(self, logged_types=['detectie', 'externeSignaalgroep'], cache_size=0, **kwargs):
 
         if len(logged_types) == 0:
             logged_types = list(MESSAGE_TYPE_DICT.keys())
@@ -34,65 +51,54 @@ class VLogParser(object):
         self.logged_types = [m_type for l_type in logged_types
                              for m_type in MESSAGE_TYPE_DICT[l_type]] + [1]  # Always log time
 
+        # Message types by code, for storing decoded device values
+        self._device_types = {m_type: l_type for l_type in logged_types for m_type in MESSAGE_TYPE_DICT[l_type]}
+
+        if cache_size:
+            self._cached_decoder = functools.lru_cache(maxsize=cache_size)(
+                functools.partial(_decode_frozen, self._payload_decoder))
+            self._decode_payload = self._decode_cached
+        else:
+            self._cached_decoder = None
+            self._decode_payload = self._payload_decoder
+
         # Set initial (empty) status
         self.status = {'timestamp': None,
                        'tijdReferentie': None}
         for key in logged_types:
-            self.status[key] = {}
+            self.status[key] = self._new_devices(key)
 
-    def _parse_status(self, message, data_size):
+    # Decodes the device values of a message payload
+    _payload_decoder = staticmethod(decode_payload)
+
+    def _new_devices(self, key):
         """
-        Parse the status part of a message.
+        Create the (empty) container of device values of a message type.
 
         Parameters
         ----------
-        message : str
-            V-log message.
-        data_size : float
-            Size of one data item, in hex.
+        key : str
+            Message type.
 
         Returns
         ----------
-        num_sensors : int
-            Number of sensors in status.
+        devices : dict
+            Empty dictionary.
         """
 
-        assert int(message[:2], 16) % 2 == 1, "Not status message"
-
-        self.status['deltaTijd'] = int(message[2:5], 16)/10 # Log in seconds
-        self._update_time()
-        num_sensors = int(hex_string_to_bits(message[5:8])[2:], 2)
+        return {}
 
-        assert len(message[8:]) >= data_size * num_sensors, "Num sensors exceeds message length"
-
-        return num_sensors
-
-    def _parse_update(self, message, data_size):
+    def _status_to_log(self):
         """
-        Parse the update part of a message.
-
-        Parameters
-        ----------
-        message : str
-            V-log message.
-        data_size : float
-            Size of one data item, in hex.
+        Status passed to log_status.
 
         Returns
         ----------
-        num_sensors : int
-            Number of sensors in status.
+        status : dict
+            V-log status.
         """
 
-        assert int(message[:2], 16) % 2 == 0, "Not update message"
-
-        self.status['deltaTijd'] = int(message[2:5], 16)/10 # Log in seconds
-        self._update_time()
-        num_sensors = int(message[5], 16)
-
-        assert len(message[6:]) >= data_size * num_sensors, "Num sensors exceeds message length"
-
-        return num_sensors
+        return self.status
 
     def parse_message(self, message):
         """
@@ -113,20 +119,7 @@ class VLogParser(object):
 
         if message_type == 1:
             # Time reference
-            # Sometimes the time is given as 24:00 not 00:00 so add the time to the date to deal with this
-            self.status['tijdReferentie'] = (
-                    datetime(
-                        int(message[2:6]),
-                        int(message[6:8]),
-                        int(message[8:10])
-                    )
-                    + timedelta(
-                        hours=int(message[10:12]),
-                        minutes=int(message[12:14]),
-                        seconds=int(message[14:16]),
-                        milliseconds=int(message[16]) * 100
-                    )
-            ).timestamp()
+            self.status['tijdReferentie'] = parse_time_reference(message)
             self.status['deltaTijd'] = 0
 
         elif message_type == 4:
@@ -141,156 +134,66 @@ class VLogParser(object):
                 i += 2
             self.status['vlogInformatie']['VRI id'] = vri_id.strip()  # Remove whitespace
 
-        elif message_type == 5:
-            # Detection status
-            num_sensors = self._parse_status(message, data_size=1)
-            for i in range(0, num_sensors):
-                self.status['detectie'][i] = parse_detection_data(message[8 + i])
-
-        elif message_type == 6:
-            # Detection update
-            num_sensors = self._parse_update(message, data_size=4)
-            for i in range(0, num_sensors):
-                index = int(message[6 + i * 4:8 + i * 4], 16)
-                if index in self.status['detectie'].keys():
-                    self.status['detectie'][index] = parse_detection_data(message[9 + i * 4])
-
-        elif message_type == 7:
-            # Other input status
-            num_sensors = self._parse_status(message, data_size=0.25)
-            status_bits = hex_string_to_bits(message[8:])
-            for i in range(0, num_sensors):
-                self.status['overigeIngangen'][i] = int(status_bits[i], 2)
-
-        elif message_type == 8:
-            # Other input update
-            num_sensors = self._parse_update(message, data_size=2)
-            for i in range(0, num_sensors):
-                status_bits = hex_string_to_bits(message[6 + i * 2:8 + i * 2])
-                index = int(status_bits[:-1], 2)
-                if index in self.status['overigeIngangen'].keys():
-                    self.status['overigeIngangen'][index] = int(status_bits[-1], 2)
-
-        elif message_type == 9:
-            # Internal phase status
-            num_sensors = self._parse_status(message, data_size=3)
-            for i in range(0, num_sensors):
-                self.status['interneFaseCyclus'][i] = parse_internal_data(message[8 + i * 3:11 + i * 3])
-
-        elif message_type == 10:
-            # Internal phase update
-            num_sensors = self._parse_update(message, data_size=6)
-            for i in range(0, num_sensors):
-                index = int(message[6 + i * 6:8 + i * 6], 16)
-                if index in self.status['interneFaseCyclus'].keys():
-                    self.status['interneFaseCyclus'][index] = parse_internal_data(message[9 + i * 6:12 + i * 6])
-
-        elif message_type == 11:
-            # Other output status (GUS)
-            num_sensors = self._parse_status(message, data_size=0.25)
-            status_bits = hex_string_to_bits(message[8:])
-            for i in range(0, num_sensors):
-                self.status['overigeUitgangenGUS'][i] = int(status_bits[i], 2)
-
-        elif message_type == 12:
-            # Other output update (GUS)
-            num_sensors = self._parse_update(message, data_size=2)
-            for i in range(0, num_sensors):
-                status_bits = hex_string_to_bits(message[6 + i * 2:8 + i * 2])
-                index = int(status_bits[:-1], 2)
-                if index in self.status['overigeUitgangenGUS'].keys():
-                    self.status['overigeUitgangenGUS'][index] = int(status_bits[-1], 2)
-
-        elif message_type == 13:
-            # External phase status
-            num_sensors = self._parse_status(message, data_size=1)
-            for i in range(0, num_sensors):
-                self.status['externeSignaalgroep'][i] = int(message[8 + i], 16)
-
-        elif message_type == 14:
-            # External phase update
-            num_sensors = self._parse_update(message, data_size=4)
-            for i in range(0, num_sensors):
-                index = int(message[6 + i * 4:8 + i * 4], 16)
-                if index in self.status['externeSignaalgroep'].keys():
-                    self.status['externeSignaalgroep'][index] = int(message[8 + i * 4:10 + i * 4], 16)
-
-        elif message_type == 15:
-            # Other output status (WUS)
-            num_sensors = self._parse_status(message, data_size=0.25)
-            status_bits = hex_string_to_bits(message[8:])
-            for i in range(0, num_sensors):
-                self.status['overigeUitgangenWUS'][i] = int(status_bits[i], 2)
-
-        elif message_type == 16:
-            # Other output update (WUS)
-            num_sensors = self._parse_update(message, data_size=2)
-            for i in range(0, num_sensors):
-                status_bits = hex_string_to_bits(message[6 + i * 2:8 + i * 2])
-                index = int(status_bits[:-1], 2)
-                if index in self.status['overigeUitgangenWUS'].keys():
-                    self.status['overigeUitgangenWUS'][index] = int(status_bits[-1], 2)
-
-        elif message_type == 17:
-            # Desired program status
-            num_sensors = self._parse_status(message, data_size=1)
-            for i in range(0, num_sensors):
-                self.status['gewensteProgrammaStatus'][i] = int(message[8 + i], 16)
-
-        elif message_type == 18:
-            # Desired program update
-            num_sensors = self._parse_update(message, data_size=2)
-            for i in range(0, num_sensors):
-                index = int(message[6 + i * 2], 16)
-                if index in self.status['gewensteProgrammaStatus'].keys():
-                    self.status['gewensteProgrammaStatus'][index] = int(message[7 + i * 2], 16)
-
-        elif message_type == 19:
-            # Actual program status
-            num_sensors = self._parse_status(message, data_size=1)
-            for i in range(0, num_sensors):
-                self.status['werkelijkeProgrammaStatus'][i] = int(message[8 + i], 16)
-
-        elif message_type == 20:
-            # Actual program update
-            num_sensors = self._parse_update(message, data_size=2)
-            for i in range(0, num_sensors):
-                index = int(message[6 + i * 2], 16)
-                if index in self.status['werkelijkeProgrammaStatus'].keys():
-                    self.status['werkelijkeProgrammaStatus'][index] = int(message[7 + i * 2], 16)
-
-        elif message_type == 23:
-            # Thermometer status
-            num_sensors = self._parse_status(message, data_size=1)
-            for i in range(0, num_sensors):
-                status_bits = hex_string_to_bits(message[8 + i])
-                self.status['thermometer'][i] = {'MVG': int(status_bits[-1], 2),
-                                                 'RNA': int(status_bits[-2], 2)}
-
-        elif message_type == 24:
-            # Thermometer update
-            num_sensors = self._parse_update(message, data_size=2)
-            for i in range(0, num_sensors):
-                status_bits = hex_string_to_bits(message[7 + i * 2])
-                index = int(message[6 + i * 2], 16)
-                if index in self.status['thermometer'].keys():
-                    self.status['thermometer'][index] = {'MVG': int(status_bits[-1], 2),
-                                                         'RNA': int(status_bits[-2], 2)}
-        elif message_type == 32:
-            # Instruction variable update
-            num_sensors = self._parse_update(message, data_size=4)
-            for i in range(0, num_sensors):
-                index = int(message[6 + i * 4:8 + i * 4], 16)
-                # Always add as no status for instruction variables
-                self.status['instructieVariabelen'][index] = parse_instruction_data(message[8 + i * 4:10 + i * 4])
-
-        elif message_type == 34:
-            # OV/hulpdienst update
-            num_sensors = self._parse_update(message, data_size=6)
-            for i in range(0, num_sensors):
-                index = int(message[6 + i * 6:8 + i * 6], 16)
-                # Always add as no status for ov/hulpdienst update
-                self.status['OVHulpdienstInformatie'][index] = parse_ovhd_data(message[8 + i * 6:12 + i * 6])
+        else:
+            # Device status or update
+            self.status['deltaTijd'] = int(message[2:5], 16)/10 # Log in seconds
+            self._update_time()
+
+            devices = self.status[self._device_types[message_type]]
+            values = self._decode_payload(message_type, message[5:])
+
+            if message_type % 2 == 1 or message_type in [32, 34]:
+                # Statuses set all devices, instruction variables and ov/hulpdienst have no status so always add
+                for index, value in values:
+                    devices[index] = value
+            else:
+                # Updates only apply to devices known from a status
+                for index, value in values:
+                    if index in devices:
+                        devices[index] = value
+
+    def _decode_cached(self, message_type, payload):
+        """
+        Decode the device values of a message payload through the cache.
+        Device dictionaries are built outside the cache, so modifying a status cannot change cached values.
+
+        Parameters
+        ----------
+        message_type : int
+            Message code.
+        payload : str
+            Message after the deltaTijd (from the sixth character on).
+
+        Returns
+        ----------
+        values : list
+            Pairs of (device index, value), in message order.
+        """
+
+        return [(index, dict(value) if isinstance(value, MappingProxyType) else value)
+                for index, value in self._cached_decoder(message_type, payload)]
+
+    def cache_info(self):
+        """
+        Statistics of the decoded payload cache.
+
+        Returns
+        ----------
+        info : dict
+            Number of cache 'hits' and 'misses', its current 'size' and 'maxsize', and the 'hitRate'.
+            None if there is no cache.
+        """
+
+        if self._cached_decoder is None:
+            return None
+
+        hits, misses, maxsize, size = self._cached_decoder.cache_info()
+
+        return {'hits': hits,
+                'misses': misses,
+                'size': size,
+                'maxsize': maxsize,
+                'hitRate': hits / (hits + misses) if hits + misses else None}
 
     def _update_time(self):
         """
@@ -302,13 +205,13 @@ class VLogParser(object):
 
             # Log status and update time
             if self.status['timestamp']:
-                self.log_status(self.status, **self._log_kwargs)
+                self.log_status(self._status_to_log(), **self._log_kwargs)
             self.status['timestamp'] = self.status['tijdReferentie'] + self.status['deltaTijd']
 
             # Wipe statuses which only exist at the timestamp of their production
             for key in WIPED_MESSAGES:
                 if key in self.status.keys():
-                    self.status[key] = {}
+                    self.status[key] = self._new_devices(key)
 
     def log_status(self, status):
         """
@@ -323,6 +226,146 @@ class VLogParser(object):
         pass
 
 
+class CompactStatusMixin(object):
+    """
+    Mixin for parser classes which stores device values packed in typed arrays (see compact.CompactDevices),
+    rather than as a dictionary per device. Put it before the parser class it is combined with, e.g.
+    class VLogParserToListCompact(CompactStatusMixin, VLogParserToList).
+    Logged statuses are converted to the usual dictionary format, unless packed_status is True.
+    The conversion builds every device dictionary again for each logged status, which makes parsing slower
+    (about 40-50% for VLogParserToList with all types), so the mixin saves memory rather than time unless
+    log_status reads the packed values itself.
+    """
+
+    # Whether log_status receives the status with compact devices
+    packed_status = False
+
+    _payload_decoder = staticmethod(decode_payload_packed)
+
+    def _new_devices(self, key):
+        """
+        Create the (empty) container of device values of a message type.
+
+        Parameters
+        ----------
+        key : str
+            Message type.
+
+        Returns
+        ----------
+        devices : compact.CompactDevices or dict
+            Empty compact devices, or dictionary for vlogInformatie.
+        """
+
+        if key == 'vlogInformatie':
+            return {}
+
+        return CompactDevices(key)
+
+    def _status_to_log(self):
+        """
+        Status passed to log_status.
+
+        Returns
+        ----------
+        status : dict
+            V-log status, with compact devices if packed_status is True.
+        """
+
+        return self.status if self.packed_status else status_to_dict(self.status)
+
+
+class VLogParserCompact(CompactStatusMixin, VLogParser):
+    """
+    Base class for parsing v-log messages to compact statuses.
+    Does not log statuses, log_status receives the status with compact devices.
+
+    Parameters
+    ----------
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to cache, see VLogParser.
+    """
+
+    packed_status = True
+
+
+class _ChangeRecorder(dict):
+    """
+    Device dictionary which records every value written to it.
+
+    Parameters
+    ----------
+    status : dict
+        Status the dictionary belongs to, used to read the current timestamp.
+    change : dict
+        Dictionary of 'timestamp', 'index' and 'value' lists to be appended to.
+    """
+
+    def __init__(self, status, change):
+
+        super().__init__()
+        self._status = status
+        self._change = change
+
+    def __setitem__(self, index, value):
+
+        super().__setitem__(index, value)
+        if isinstance(value, dict):
+            # Store the fields once and the values as a tuple
+            if 'fields' not in self._change:
+                self._change['fields'] = list(value.keys())
+            value = tuple(value.values())
+        self._change['timestamp'].append(self._status['timestamp'])
+        self._change['index'].append(index)
+        self._change['value'].append(value)
+
+
+class VLogParserToChanges(VLogParser):
+    """
+    Class for parsing v-log messages to a stream of device changes.
+    Records every device value as it is decoded, rather than logging full statuses.
+    Message types which only exist at their timestamp (messagetypes.WIPED_MESSAGES) and
+    vlogInformatie are not recorded.
+
+    Parameters
+    ----------
+    changes : dict
+        Dictionary to be filled with, per message type, lists of 'timestamp', 'index' and 'value'
+        (plus 'fields' for devices whose value is a dictionary).
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to cache, see VLogParser.
+    """
+
+    def __init__(self, changes, logged_types=['detectie', 'externeSignaalgroep'], cache_size=0):
+
+        super().__init__(logged_types, cache_size=cache_size, changes=changes)
+
+        for key in self.status.keys():
+            if key in MESSAGE_TYPE_DICT and key not in WIPED_MESSAGES + ['vlogInformatie']:
+                changes[key] = {'timestamp': [], 'index': [], 'value': []}
+                self.status[key] = _ChangeRecorder(self.status, changes[key])
+
+    def log_status(self, status, changes):
+        """
+        Placeholder function, changes are recorded as messages are parsed.
+
+        Parameters
+        ----------
+        status : dict
+            V-log status to be logged.
+        changes : dict
+            Dictionary of recorded changes.
+        """
+
+        pass
+
+
 class VLogParserToList(VLogParser):
     """
     Class for parsing v-log messages to a list of statuses.
@@ -335,11 +378,13 @@ class VLogParserToList(VLogParser):
     logged_types : list
         Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
         If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to cache, see VLogParser.
     """
 
-    def __init__(self, status_list, logged_types=['detectie', 'externeSignaalgroep']):
+    def __init__(self, status_list, logged_types=['detectie', 'externeSignaalgroep'], cache_size=0):
 
-        super().__init__(logged_types, status_list=status_list)
+        super().__init__(logged_types, cache_size=cache_size, status_list=status_list)
 
     def log_status(self, status, status_list):
         """
@@ -357,6 +402,77 @@ class VLogParserToList(VLogParser):
         status_list.append(ujson.loads(ujson.dumps(status)))
 
 
+class VLogParserToPipeline(VLogParser):
+    """
+    Class for parsing v-log messages to a pipeline of sinks on worker threads.
+    Passes a snapshot of each logged status to a pipeline.SinkPipeline, so slow sinks do not stall parsing.
+
+    Parameters
+    ----------
+    pipeline : pipeline.SinkPipeline
+        Pipeline to pass statuses to.
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to cache, see VLogParser.
+    """
+
+    def __init__(self, pipeline, logged_types=['detectie', 'externeSignaalgroep'], cache_size=0):
+
+        super().__init__(logged_types, cache_size=cache_size, pipeline=pipeline)
+
+    def log_status(self, status, pipeline):
+        """
+        Pass the status to the pipeline.
+
+        Parameters
+        ----------
+        status : dict
+            V-log status to be logged.
+        pipeline : pipeline.SinkPipeline
+            Pipeline to pass statuses to.
+        """
+
+        pipeline.put(status)
+
+
+class VLogParserToSharedMemory(VLogParser):
+    """
+    Class for parsing v-log messages to shared memory.
+    Publishes each logged status with a shared.SharedStatusWriter, so any number of local processes can read
+    the latest status with a shared.SharedStatusReader.
+
+    Parameters
+    ----------
+    writer : shared.SharedStatusWriter
+        Writer to publish statuses with.
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to cache, see VLogParser.
+    """
+
+    def __init__(self, writer, logged_types=['detectie', 'externeSignaalgroep'], cache_size=0):
+
+        super().__init__(logged_types, cache_size=cache_size, writer=writer)
+
+    def log_status(self, status, writer):
+        """
+        Publish the status to shared memory.
+
+        Parameters
+        ----------
+        status : dict
+            V-log status to be logged.
+        writer : shared.SharedStatusWriter
+            Writer to publish statuses with.
+        """
+
+        writer.publish(status)
+
+
 class VLogParserToJson(VLogParser):
     """
     Class for parsing v-log messages to a json of statuses.
@@ -369,11 +485,13 @@ class VLogParserToJson(VLogParser):
     logged_types : list
         Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
         If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to cache, see VLogParser.
     """
 
-    def __init__(self, path_to_json, logged_types=['detectie', 'externeSignaalgroep']):
+    def __init__(self, path_to_json, logged_types=['detectie', 'externeSignaalgroep'], cache_size=0):
 
-        super().__init__(logged_types, path_to_json=path_to_json)
+        super().__init__(logged_types, cache_size=cache_size, path_to_json=path_to_json)
 
     def log_status(self, status, path_to_json):
         """
@@ -398,4 +516,166 @@ class VLogParserToJson(VLogParser):
                 f.truncate()
                 f.write(','.encode())
                 f.write(ujson.dumps(status).encode())
-                f.write(']'.encode())
\ No newline at end of file
+                f.write(']'.encode())
+
+
+class VLogParserToJsonStream(VLogParser):
+    """
+    Class for parsing v-log messages to a json array of statuses written to an open file.
+    Unlike VLogParserToJson the file is kept open, so it can be used with stdout or pipes.
+    Call .close() once parsing is finished to write the final status and end the array.
+
+    Parameters
+    ----------
+    f : file
+        Open text file to write to.
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to cache, see VLogParser.
+    """
+
+    def __init__(self, f, logged_types=['detectie', 'externeSignaalgroep'], cache_size=0):
+
+        super().__init__(logged_types, cache_size=cache_size, f=f)
+        self._separator = '['
+
+    def log_status(self, status, f):
+        """
+        Append the status to the json array.
+
+        Parameters
+        ----------
+        status : dict
+            V-log status to be logged.
+        f : file
+            Open text file to write to.
+        """
+
+        f.write(self._separator)
+        f.write(ujson.dumps(status))
+        self._separator = ','
+
+    def close(self):
+        """
+        Log the final status and end the json array, the file itself is not closed.
+        """
+
+        if self.status['timestamp']:
+            self.log_status(self._status_to_log(), **self._log_kwargs)
+
+        f = self._log_kwargs['f']
+        if self._separator == '[':
+            f.write('[')
+        f.write(']\n')
+        f.flush()
+
+
+class VLogParserToSqlite(CompactStatusMixin, VLogParser):
+    """
+    Class for parsing v-log messages to an SQLite database of statuses.
+    Stores one row per device with its fields packed into a single value (see sqlite.SCHEMA),
+    inserted in batched transactions. The status is kept compact (see CompactStatusMixin),
+    so the packed values are stored as they are decoded.
+    Call .close() once parsing is finished to write the final status and any remaining rows.
+
+    Parameters
+    ----------
+    path_to_db : str
+        Path to SQLite database.
+    intersection : str
+        Name of the intersection. If None the 'VRI id' of vlogInformatie is used, if logged.
+    changes_only : bool
+        If True only store devices whose value differs from the previously stored value,
+        otherwise store the full status at every timestamp. Values of messagetypes.WIPED_MESSAGES are events,
+        so they are always stored.
+    batch_size : int
+        Number of rows to insert per transaction.
+    logged_types : list
+        Message types (should match keys of messagetypes.MESSAGE_TYPE_DICT) to be logged.
+        If empty list all types are logged.
+    cache_size : int
+        Number of decoded message payloads to cache, see VLogParser.
+    """
+
+    packed_status = True
+
+    def __init__(self, path_to_db, intersection=None, changes_only=True, batch_size=100000,
+                 logged_types=['detectie', 'externeSignaalgroep'], cache_size=0):
+
+        super().__init__(logged_types, cache_size=cache_size)
+
+        self.connection = sqlite.connect(path_to_db)
+        self.intersection = intersection
+        self.changes_only = changes_only
+        self.batch_size = batch_size
+        self._rows = []
+        self._last_packed = {}
+        self._device_type_ids = {}
+
+    def log_status(self, status):
+        """
+        Add a row per (changed) device to the batch, inserting the batch once full.
+
+        Parameters
+        ----------
+        status : dict
+            V-log status to be logged, with compact.CompactDevices or dictionaries per message type.
+        """
+
+        intersection = self.intersection
+        if intersection is None:
+            intersection = status.get('vlogInformatie', {}).get('VRI id', '')
+
+        timestamp = status['timestamp']
+        rows = self._rows
+        for key, devices in status.items():
+            if key not in PACKED_FIELDS:
+                continue
+            device_type_id = sqlite.lookup_device_type(self.connection, key, self._device_type_ids)
+
+            if isinstance(devices, CompactDevices):
+                packed = devices.packed
+            else:
+                fields = PACKED_FIELDS[key]
+                packed_devices = CompactDevices(key)
+                for index, value in devices.items():
+                    packed_devices[index] = pack(fields, value)
+                packed = packed_devices.packed
+
+            # Wiped types only hold the events at this timestamp, so a repeated value is a new event
+            if not self.changes_only or key in WIPED_MESSAGES:
+                rows.extend([(intersection, timestamp, device_type_id, index, value)
+                             for index, value in enumerate(packed) if value != MISSING_PACKED])
+                continue
+
+            last = self._last_packed.get((intersection, key), ())
+            if packed == last:
+                continue
+            self._last_packed[(intersection, key)] = array('H', packed)
+            rows.extend([(intersection, timestamp, device_type_id, index, value)
+                         for index, value in enumerate(packed)
+                         if value != MISSING_PACKED and (index >= len(last) or value != last[index])])
+
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Insert all batched rows in a single transaction.
+        """
+
+        with self.connection:
+            self.connection.executemany(sqlite.INSERT_STATUS, self._rows)
+        self._rows = []
+
+    def close(self):
+        """
+        Log the final status, insert any remaining rows and close the database.
+        """
+
+        if self.status['timestamp']:
+            self.log_status(self._status_to_log())
+        self.flush()
+        self.connection.close()
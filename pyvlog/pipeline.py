@@ -0,0 +1,281 @@
+"""
+Classes for passing logged statuses to sinks on worker threads.
+"""
+
+
+from .compact import CompactDevices
+from collections import deque
+from types import MappingProxyType
+import threading
+
+
+# Policies for when a sink's queue is full
+BACKPRESSURE_POLICIES = ['block', 'drop-oldest', 'coalesce']
+
+
+def _freeze(value):
+    """
+    Read-only copy of the devices of a message type (or any other status value).
+    """
+
+    if isinstance(value, dict):
+        return MappingProxyType({index: MappingProxyType(device) if isinstance(device, dict) else device
+                                 for index, device in value.items()})
+    if isinstance(value, CompactDevices):
+        return value.freeze()
+
+    return value
+
+
+class _SinkQueue(object):
+    """
+    Bounded queue of statuses for a single sink, with a backpressure policy.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of statuses waiting in the queue.
+    policy : str
+        Behaviour when the queue is full (one of BACKPRESSURE_POLICIES).
+    """
+
+    def __init__(self, maxsize, policy):
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._in_progress = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+
+        self.metrics = {'depth': 0,
+                        'max_depth': 0,
+                        'enqueued': 0,
+                        'processed': 0,
+                        'dropped': 0,
+                        'coalesced': 0,
+                        'errors': 0}
+
+    def put(self, item):
+        """
+        Add a status to the queue, applying the backpressure policy if full.
+
+        Parameters
+        ----------
+        item : dict
+            Status to be added.
+
+        Returns
+        ----------
+        queued : bool
+            False if the queue was closed before the status could be added.
+        """
+
+        with self._lock:
+            if self._closed:
+                return False
+
+            if len(self._items) >= self.maxsize:
+                if self.policy == 'block':
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        return False
+                elif self.policy == 'drop-oldest':
+                    self._items.popleft()
+                    self.metrics['dropped'] += 1
+                elif self.policy == 'coalesce':
+                    # The newest status supersedes the last one still waiting
+                    self._items.pop()
+                    self.metrics['coalesced'] += 1
+
+            self._items.append(item)
+            self.metrics['enqueued'] += 1
+            self.metrics['depth'] = len(self._items)
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], len(self._items))
+            self._not_empty.notify()
+
+        return True
+
+    def get(self):
+        """
+        Take the oldest status from the queue, waiting until one is available.
+
+        Returns
+        ----------
+        item : dict or None
+            Oldest status, or None if the queue is closed and empty.
+        """
+
+        with self._lock:
+            while not self._items and not self._closed:
+                self._not_empty.wait()
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._in_progress += 1
+            self.metrics['depth'] = len(self._items)
+            self._not_full.notify()
+            return item
+
+    def task_done(self, error=False):
+        """
+        Mark the last status taken from the queue as processed.
+
+        Parameters
+        ----------
+        error : bool
+            Whether the sink raised an exception on the status.
+        """
+
+        with self._lock:
+            self._in_progress -= 1
+            self.metrics['processed'] += 1
+            if error:
+                self.metrics['errors'] += 1
+            if not self._items and self._in_progress == 0:
+                self._all_done.notify_all()
+
+    def join(self):
+        """
+        Wait until every status in the queue has been processed.
+        """
+
+        with self._lock:
+            while self._items or self._in_progress:
+                self._all_done.wait()
+
+    def close(self):
+        """
+        Close the queue, workers exit once it is empty.
+        """
+
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+
+class SinkPipeline(object):
+    """
+    Pipeline passing statuses to sinks, each running on its own worker thread.
+    Each sink receives statuses in order through its own bounded queue, so a slow sink does not stall
+    parsing (unless the 'block' policy is used) or the other sinks.
+
+    Parameters
+    ----------
+    sinks : list
+        Callables taking a single status, a read-only mapping shared between sinks.
+    maxsize : int
+        Maximum number of statuses waiting for each sink.
+    policy : str
+        Behaviour when a sink's queue is full:
+        'block' waits for space, 'drop-oldest' discards the oldest waiting status,
+        'coalesce' replaces the newest waiting status with the new one.
+    """
+
+    def __init__(self, sinks, maxsize=1000, policy='block'):
+
+        assert policy in BACKPRESSURE_POLICIES, "policy not understood"
+        assert maxsize > 0, "maxsize must be positive"
+
+        self.sinks = list(sinks)
+        self.exceptions = []
+        self._queues = [_SinkQueue(maxsize, policy) for _ in self.sinks]
+        self._threads = [threading.Thread(target=self._run, args=(sink, q), daemon=True)
+                         for sink, q in zip(self.sinks, self._queues)]
+        self._closed = False
+
+        for t in self._threads:
+            t.start()
+
+    def _run(self, sink, q):
+        """
+        Worker loop passing statuses from a queue to a sink.
+
+        Parameters
+        ----------
+        sink : callable
+            Sink to pass statuses to.
+        q : _SinkQueue
+            Queue to take statuses from.
+        """
+
+        while True:
+            status = q.get()
+            if status is None:
+                return
+            try:
+                sink(status)
+            except Exception as e:
+                self.exceptions.append(e)
+                q.task_done(error=True)
+            else:
+                q.task_done()
+
+    def put(self, status):
+        """
+        Take a read-only snapshot of the status and queue it for every sink.
+        The snapshot copies the status and its devices per message type, and makes each device read-only.
+        Device dictionaries are shared with the parser, which replaces rather than modifies them.
+
+        Parameters
+        ----------
+        status : dict
+            V-log status.
+        """
+
+        assert not self._closed, "Pipeline is closed"
+
+        snapshot = MappingProxyType({key: _freeze(value) for key, value in status.items()})
+        for q in self._queues:
+            q.put(snapshot)
+
+    def flush(self):
+        """
+        Wait until every queued status has been passed to its sinks.
+        """
+
+        for q in self._queues:
+            q.join()
+
+    def close(self):
+        """
+        Flush all queued statuses and stop the worker threads.
+        The first exception raised by a sink, if any, is re-raised.
+        """
+
+        if not self._closed:
+            self.flush()
+            self._closed = True
+            for q in self._queues:
+                q.close()
+            for t in self._threads:
+                t.join()
+
+        if self.exceptions:
+            raise self.exceptions[0]
+
+    def metrics(self):
+        """
+        Queue metrics per sink.
+
+        Returns
+        ----------
+        metrics : list
+            Dictionary per sink of current 'depth', 'max_depth', and counts of statuses
+            'enqueued', 'processed', 'dropped', 'coalesced' and 'errors'.
+        """
+
+        return [dict(q.metrics) for q in self._queues]
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.close()
@@ -0,0 +1,331 @@
+"""
+Classes for replaying recorded v-log messages with their original timing, for load testing.
+"""
+
+
+from .merge import timed_messages
+from array import array
+import heapq
+import queue
+import socket
+import threading
+import time
+
+
+def schedule(messages):
+    """
+    Time of each v-log message relative to the first time reference, reconstructed from deltaTijd.
+    Messages before the first time reference are due immediately.
+
+    Parameters
+    ----------
+    messages : iterable
+        V-log messages.
+
+    Returns
+    ----------
+    schedule : generator
+        Tuples of (offset in seconds, message).
+    """
+
+    start = None
+    for t, m, reference in timed_messages(messages):
+        if t == float('-inf'):
+            yield 0.0, m
+            continue
+        if start is None:
+            start = t
+        yield (t - start) / 10, m
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    Percentiles of a set of samples (nearest rank).
+
+    Parameters
+    ----------
+    samples : iterable
+        Samples.
+    points : tuple
+        Percentiles to compute.
+
+    Returns
+    ----------
+    percentiles : dict
+        Value per percentile, e.g. 'p99', None if there are no samples.
+    """
+
+    samples = sorted(samples)
+    result = {}
+    for p in points:
+        key = 'p{}'.format(p)
+        if samples:
+            result[key] = samples[min(len(samples) - 1, max(0, int(round(p / 100 * len(samples))) - 1))]
+        else:
+            result[key] = None
+
+    return result
+
+
+def _tag_schedule(messages, i, name):
+    """
+    Add the index and name of the intersection to its schedule, so that intersections are merged in a fixed order.
+    """
+
+    for offset, m in schedule(messages):
+        yield offset, i, name, m
+
+
+class Replayer(object):
+    """
+    Re-emits the messages of any number of intersections with their original timing.
+    All intersections start together.
+
+    Parameters
+    ----------
+    sources : dict
+        V-log messages per intersection name.
+    target : callable
+        Called with (intersection name, message) for each message, e.g. a ParserTarget or StreamTarget.
+    speed : float
+        Speed-up factor of the original timing, if None messages are emitted as fast as possible.
+    """
+
+    def __init__(self, sources, target, speed=1.0):
+
+        assert speed is None or speed > 0, "speed must be positive"
+
+        self.sources = sources
+        self.target = target
+        self.speed = speed
+
+    def run(self, max_duration=None):
+        """
+        Emit all messages, or until max_duration has passed.
+
+        Parameters
+        ----------
+        max_duration : float
+            Maximum (wall clock) duration of the replay in seconds, if None there is no limit.
+
+        Returns
+        ----------
+        report : dict
+            Number of 'messages' emitted, 'duration', 'messagesPerSecond' and percentiles of the 'lag'
+            (seconds emitted behind schedule).
+        """
+
+        scheduled = [_tag_schedule(messages, i, name) for i, (name, messages) in enumerate(self.sources.items())]
+
+        lags = array('d')
+        num_messages = 0
+        start = time.perf_counter()
+
+        for offset, i, name, m in heapq.merge(*scheduled):
+            now = time.perf_counter()
+            if self.speed is not None:
+                due = start + offset / self.speed
+                if due > now:
+                    time.sleep(due - now)
+                    now = time.perf_counter()
+                lags.append(max(0.0, now - due))
+
+            self.target(name, m)
+            num_messages += 1
+
+            if max_duration is not None and now - start >= max_duration:
+                break
+
+        duration = time.perf_counter() - start
+
+        return {'messages': num_messages,
+                'duration': duration,
+                'messagesPerSecond': num_messages / duration if duration else None,
+                'lag': percentiles(lags)}
+
+
+class ParserTarget(object):
+    """
+    Feeds replayed messages to parsers, one worker thread and queue per intersection,
+    measuring the latency from emitting a message to the status it completes being logged.
+
+    Parameters
+    ----------
+    parsers : dict
+        Parser (VLogParser or subclass) per intersection name.
+    """
+
+    def __init__(self, parsers):
+
+        self.parsers = parsers
+        self.latencies = array('d')
+        self.max_backlog = 0
+        self._queues = {name: queue.Queue() for name in parsers}
+        self._threads = [threading.Thread(target=self._run, args=(parsers[name], q), daemon=True)
+                         for name, q in self._queues.items()]
+
+        for t in self._threads:
+            t.start()
+
+    def __call__(self, name, message):
+
+        q = self._queues[name]
+        q.put((time.perf_counter(), message))
+        self.max_backlog = max(self.max_backlog, q.qsize())
+
+    def _run(self, parser, q):
+        """
+        Worker loop parsing messages from a queue.
+
+        Parameters
+        ----------
+        parser : VLogParser
+            Parser to feed.
+        q : queue.Queue
+            Queue to take (emit time, message) from.
+        """
+
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            emitted, m = item
+            timestamp = parser.status['timestamp']
+            parser.parse_message(m)
+            if timestamp is not None and parser.status['timestamp'] != timestamp:
+                # This message completed the previous status, which has now been logged
+                self.latencies.append(time.perf_counter() - emitted)
+
+    def close(self):
+        """
+        Wait for all queued messages to be parsed, stop the worker threads
+        and close the parsers which have a close method (e.g. to write their final status).
+        """
+
+        for q in self._queues.values():
+            q.put(None)
+        for t in self._threads:
+            t.join()
+        for parser in self.parsers.values():
+            if hasattr(parser, 'close'):
+                parser.close()
+
+    def report(self):
+        """
+        Latency and backlog of the parsers.
+
+        Returns
+        ----------
+        report : dict
+            Percentiles of the message to status 'latency' in seconds, number of 'statuses'
+            and the 'maxBacklog' of messages waiting for a parser.
+        """
+
+        return {'latency': percentiles(self.latencies),
+                'statuses': len(self.latencies),
+                'maxBacklog': self.max_backlog}
+
+
+class StreamTarget(object):
+    """
+    Writes replayed messages (each on a new line) to a text stream per intersection, e.g. pipes.
+
+    Parameters
+    ----------
+    streams : dict
+        Open text stream per intersection name.
+    """
+
+    def __init__(self, streams):
+
+        self.streams = streams
+
+    def __call__(self, name, message):
+
+        f = self.streams[name]
+        f.write(message + '\n')
+        f.flush()
+
+    def close(self):
+        """
+        Flush all streams.
+        """
+
+        for f in self.streams.values():
+            f.flush()
+
+
+class TcpTarget(StreamTarget):
+    """
+    Sends replayed messages (each on a new line) over a TCP connection per intersection.
+
+    Parameters
+    ----------
+    address : tuple
+        (host, port) to connect to.
+    names : list
+        Intersection names.
+    """
+
+    def __init__(self, address, names):
+
+        self.sockets = [socket.create_connection(address) for _ in names]
+        super().__init__({name: s.makefile('w', encoding='utf-8') for name, s in zip(names, self.sockets)})
+
+    def close(self):
+        """
+        Flush and close all connections.
+        """
+
+        super().close()
+        for f in self.streams.values():
+            f.close()
+        for s in self.sockets:
+            s.close()
+
+
+def find_max_throughput(sources, make_parsers, speeds=(1, 10, 100, 1000), max_latency=0.1, max_duration=10):
+    """
+    Replay into parsers at increasing speeds, to find the message rate at which they start to fall behind.
+    A run falls behind when the 99th percentile of the message to status latency, or of the replay lag,
+    exceeds max_latency.
+
+    Parameters
+    ----------
+    sources : dict
+        List of v-log messages per intersection name.
+    make_parsers : callable
+        Called with the intersection names, returns a new parser per intersection name for each run.
+    speeds : tuple
+        Speed-up factors to run, in increasing order.
+    max_latency : float
+        Largest acceptable latency in seconds.
+    max_duration : float
+        Maximum duration of each run in seconds.
+
+    Returns
+    ----------
+    report : dict
+        Report per speed in 'runs' and the highest 'sustainedMessagesPerSecond' of the runs which kept up.
+    """
+
+    runs = []
+    sustained = None
+
+    for speed in speeds:
+        target = ParserTarget(make_parsers(list(sources.keys())))
+        run = Replayer(sources, target, speed=speed).run(max_duration=max_duration)
+        target.close()
+        run.update(target.report())
+        run['speed'] = speed
+
+        p99 = [run['latency']['p99'], run['lag']['p99']]
+        run['fallingBehind'] = any(p is not None and p > max_latency for p in p99)
+        runs.append(run)
+
+        if run['fallingBehind']:
+            break
+        sustained = run['messagesPerSecond']
+
+    return {'runs': runs,
+            'sustainedMessagesPerSecond': sustained}
@@ -0,0 +1,322 @@
+"""
+Classes for publishing the latest status in shared memory, for reading by other local processes.
+
+The shared memory block has a fixed layout: a header (magic, layout length, version counter and timing fields),
+the layout as json (message type, number of devices and fields per type), then one int16 value per field
+of each device (-1 if unknown). The version counter is odd while the writer updates the block,
+so readers can check they copied a consistent snapshot (a seqlock).
+"""
+
+
+from .messagetypes import DEVICE_FIELDS
+from . import compact
+from array import array
+import struct
+import time
+import ujson
+
+
+MAGIC = b'PYVL'
+
+# Magic, layout length, version, timestamp, tijdReferentie, deltaTijd
+HEADER = struct.Struct('<4sIQddd')
+VERSION = struct.Struct('<Q')
+VERSION_OFFSET = 8
+TIMES = struct.Struct('<ddd')
+TIMES_OFFSET = 16
+
+MISSING = -1
+
+
+def _layout_offsets(layout):
+    """
+    Offset (in values) of each message type in the data block.
+
+    Parameters
+    ----------
+    layout : list
+        Lists of [message type, number of devices, fields].
+
+    Returns
+    ----------
+    offsets : list
+        Tuples of (message type, number of devices, fields, offset), and the total number of values.
+    """
+
+    offsets = []
+    offset = 0
+    for key, num_devices, fields in layout:
+        offsets.append((key, num_devices, fields, offset))
+        offset += num_devices * len(fields)
+
+    return offsets, offset
+
+
+def _attach(name):
+    """
+    Attach to an existing shared memory block, without the resource tracker unlinking it when this process exits.
+    """
+
+    from multiprocessing import shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching always registers the block with the resource tracker
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedStatusWriter(object):
+    """
+    Publishes statuses into a new shared memory block.
+
+    Parameters
+    ----------
+    devices : dict
+        Number of devices to publish per message type (keys of messagetypes.DEVICE_FIELDS).
+        Devices with a higher index are not published.
+    name : str
+        Name of the shared memory block, if None a unique name is generated (see .name).
+    """
+
+    def __init__(self, devices, name=None):
+
+        from multiprocessing import shared_memory
+
+        assert set(devices.keys()).issubset(DEVICE_FIELDS.keys()), "device types not understood"
+        assert all(n > 0 for n in devices.values()), "number of devices must be positive"
+
+        layout = [[key, num_devices, DEVICE_FIELDS[key]] for key, num_devices in devices.items()]
+        layout_bytes = ujson.dumps(layout).encode()
+        layout_bytes += b' ' * (-len(layout_bytes) % 8)  # Align the data block
+
+        self._offsets, num_values = _layout_offsets(layout)
+        self._data_offset = HEADER.size + len(layout_bytes)
+        self._data_end = self._data_offset + 2 * num_values
+        self._empty = array('h', [MISSING]) * num_values
+        self._version = 0
+
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=self._data_end)
+        self.name = self.shm.name
+
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, len(layout_bytes), 0, float('nan'), float('nan'), float('nan'))
+        self.shm.buf[HEADER.size:self._data_offset] = layout_bytes
+        self.shm.buf[self._data_offset:self._data_end] = self._empty.tobytes()
+
+    def publish(self, status):
+        """
+        Write a status into the shared memory block.
+
+        Parameters
+        ----------
+        status : dict
+            V-log status to be published, with dictionaries or compact.CompactDevices per message type.
+        """
+
+        # Pack the values first so the block is only inconsistent for a single copy
+        values = array('h', self._empty)
+        for key, num_devices, fields, offset in self._offsets:
+            devices = status.get(key, {})
+            if isinstance(devices, compact.CompactDevices):
+                # Unpack the fields straight from the packed values, in the same order as DEVICE_FIELDS
+                packed_fields = [(shift, (1 << width) - 1) for field, shift, width in devices.fields]
+                position = offset
+                for packed in devices.packed[:num_devices]:
+                    if packed == compact.MISSING:
+                        position += len(fields)
+                        continue
+                    for shift, mask in packed_fields:
+                        values[position] = (packed >> shift) & mask
+                        position += 1
+                continue
+
+            for index, value in devices.items():
+                index = int(index)
+                if index >= num_devices:
+                    continue
+                position = offset + index * len(fields)
+                if isinstance(value, dict):
+                    for field in fields:
+                        values[position] = value[field]
+                        position += 1
+                else:
+                    values[position] = value
+
+        times = [status.get(key) for key in ['timestamp', 'tijdReferentie', 'deltaTijd']]
+        times = [float('nan') if t is None else t for t in times]
+
+        buf = self.shm.buf
+        self._version += 1
+        VERSION.pack_into(buf, VERSION_OFFSET, self._version)
+        TIMES.pack_into(buf, TIMES_OFFSET, *times)
+        buf[self._data_offset:self._data_end] = values.tobytes()
+        self._version += 1
+        VERSION.pack_into(buf, VERSION_OFFSET, self._version)
+
+    def close(self, unlink=True):
+        """
+        Close the shared memory block.
+
+        Parameters
+        ----------
+        unlink : bool
+            Whether to also remove the block, after which no new readers can attach.
+        """
+
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedStatusSnapshot(object):
+    """
+    Consistent copy of a published status.
+    Device values are read-only views onto the copied values.
+
+    Parameters
+    ----------
+    times : tuple
+        timestamp, tijdReferentie and deltaTijd of the status, nan if unknown.
+    data : bytes
+        Copy of the values in the block.
+    version : int
+        Version of the copied status.
+    offsets : list
+        Tuples of (message type, number of devices, fields, offset).
+    """
+
+    def __init__(self, times, data, version, offsets):
+
+        self.version = version
+        self.timestamp, self.tijdReferentie, self.deltaTijd = times
+        self._view = memoryview(data)
+        self._offsets = {key: (num_devices, fields, offset) for key, num_devices, fields, offset in offsets}
+
+    def fields(self, key):
+        """
+        Fields of each device of a message type.
+
+        Parameters
+        ----------
+        key : str
+            Message type.
+
+        Returns
+        ----------
+        fields : list
+            Field names.
+        """
+
+        return self._offsets[key][1]
+
+    def values(self, key):
+        """
+        Values of all devices of a message type, -1 where unknown.
+
+        Parameters
+        ----------
+        key : str
+            Message type.
+
+        Returns
+        ----------
+        values : memoryview
+            Read-only view of shape (number of devices, number of fields).
+        """
+
+        num_devices, fields, offset = self._offsets[key]
+        start = offset * 2
+        end = start + num_devices * len(fields) * 2
+
+        return self._view[start:end].cast('h', [num_devices, len(fields)])
+
+    def to_dict(self):
+        """
+        Convert the snapshot to a status dictionary, in the format of VLogParser.status.
+        Unknown devices are left out.
+
+        Returns
+        ----------
+        status : dict
+            V-log status.
+        """
+
+        status = {}
+        for key in ['timestamp', 'tijdReferentie', 'deltaTijd']:
+            value = getattr(self, key)
+            status[key] = None if value != value else value  # nan is unknown
+
+        for key, (num_devices, fields, offset) in self._offsets.items():
+            rows = self.values(key).tolist()
+            status[key] = {}
+            for index, row in enumerate(rows):
+                if row[0] == MISSING:
+                    continue
+                status[key][index] = row[0] if fields == ['state'] else dict(zip(fields, row))
+
+        return status
+
+
+class SharedStatusReader(object):
+    """
+    Reads statuses published by a SharedStatusWriter in another process.
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block.
+    """
+
+    def __init__(self, name):
+
+        self.shm = _attach(name)
+
+        magic, layout_length = HEADER.unpack_from(self.shm.buf, 0)[:2]
+        assert magic == MAGIC, "Not a pyvlog shared status"
+        layout = ujson.loads(bytes(self.shm.buf[HEADER.size:HEADER.size + layout_length]))
+
+        self._offsets, num_values = _layout_offsets(layout)
+        self._data_offset = HEADER.size + layout_length
+        self._data_end = self._data_offset + 2 * num_values
+
+    @property
+    def version(self):
+        """
+        Current version of the published status, increases by 2 per status.
+        """
+
+        return VERSION.unpack_from(self.shm.buf, VERSION_OFFSET)[0]
+
+    def read(self):
+        """
+        Copy the latest status, retrying while the writer is updating it.
+        Each snapshot costs one copy of the timing fields and the values (2 bytes per field of each device),
+        the header and layout are not copied.
+
+        Returns
+        ----------
+        snapshot : SharedStatusSnapshot
+            Consistent snapshot of the latest status.
+        """
+
+        buf = self.shm.buf
+        while True:
+            version = VERSION.unpack_from(buf, VERSION_OFFSET)[0]
+            if version % 2 == 0:
+                times = TIMES.unpack_from(buf, TIMES_OFFSET)
+                data = bytes(buf[self._data_offset:self._data_end])
+                if VERSION.unpack_from(buf, VERSION_OFFSET)[0] == version:
+                    return SharedStatusSnapshot(times, data, version, self._offsets)
+            time.sleep(0)
+
+    def close(self):
+        """
+        Detach from the shared memory block.
+        """
+
+        self.shm.close()
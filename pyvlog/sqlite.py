@@ -0,0 +1,221 @@
+"""
+Functions for storing statuses in and querying them from SQLite.
+"""
+
+
+from .messagetypes import PACKED_FIELDS
+
+
+# Version of the schema, stored as the user_version of the database
+SCHEMA_VERSION = 2
+
+# One row per device, with the fields of the device packed into its value (see messagetypes.PACKED_FIELDS)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_type (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS field (
+    device_type_id INTEGER NOT NULL REFERENCES device_type(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    shift INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    PRIMARY KEY (device_type_id, position)
+);
+CREATE TABLE IF NOT EXISTS status (
+    intersection TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    device_type_id INTEGER NOT NULL REFERENCES device_type(id),
+    device_index INTEGER NOT NULL,
+    value INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS status_by_time
+    ON status (timestamp, device_type_id, device_index, intersection);
+CREATE INDEX IF NOT EXISTS status_by_device
+    ON status (device_type_id, device_index, timestamp, intersection);
+CREATE VIEW IF NOT EXISTS status_named AS
+    SELECT s.intersection, s.timestamp, d.name AS device_type, s.device_index, f.name AS field,
+           (s.value >> f.shift) & ((1 << f.width) - 1) AS value
+    FROM status s JOIN device_type d ON s.device_type_id = d.id JOIN field f ON s.device_type_id = f.device_type_id;
+"""
+
+INSERT_STATUS = "INSERT INTO status VALUES (?, ?, ?, ?, ?)"
+
+# Filtering on the columns of the status table (rather than the names of the view) lets SQLite use its indexes
+SELECT_STATUS = """
+    SELECT s.intersection, s.timestamp, d.name, s.device_index, f.name, (s.value >> f.shift) & ((1 << f.width) - 1)
+    FROM status s JOIN device_type d ON s.device_type_id = d.id JOIN field f ON s.device_type_id = f.device_type_id"""
+
+
+def connect(path_to_db):
+    """
+    Open an SQLite database of statuses, creating the schema if needed.
+    The database is put in WAL mode, so it can be queried while being written.
+
+    Parameters
+    ----------
+    path_to_db : str
+        Path to SQLite database.
+
+    Returns
+    ----------
+    connection : sqlite3.Connection
+        Connection to the database.
+    """
+
+    # sqlite3 is imported here so that importing the parsers stays fast
+    import sqlite3
+
+    # A parser may be created in one thread and used in another (e.g. by replay.ParserTarget), never by two at once
+    connection = sqlite3.connect(path_to_db, check_same_thread=False)
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0:
+        tables = connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'status'").fetchone()[0]
+        assert tables == 0, "Database has a schema from an older version of pyvlog"
+    else:
+        assert version == SCHEMA_VERSION, "Database schema version not understood"
+
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA cache_size=-65536")  # 64 MB, keeps more of the indexes in memory while inserting
+    connection.executescript(SCHEMA)
+    connection.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+    return connection
+
+
+def lookup_device_type(connection, name, cache):
+    """
+    Get the id of a message type, inserting it and the layout of its fields if new.
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection to the database.
+    name : str
+        Message type (key of messagetypes.PACKED_FIELDS).
+    cache : dict
+        Cache of already looked up message types to ids.
+
+    Returns
+    ----------
+    id : int
+        Id of the message type.
+    """
+
+    if name not in cache:
+        with connection:
+            connection.execute("INSERT OR IGNORE INTO device_type (name) VALUES (?)", (name,))
+            device_type_id = connection.execute("SELECT id FROM device_type WHERE name = ?", (name,)).fetchone()[0]
+            connection.executemany("INSERT OR IGNORE INTO field VALUES (?, ?, ?, ?, ?)",
+                                   [(device_type_id, position, str(field), shift, width)
+                                    for position, (field, shift, width) in enumerate(PACKED_FIELDS[name])])
+        cache[name] = device_type_id
+
+    return cache[name]
+
+
+def _device_type_id(connection, device_type):
+    """
+    Get the id of a message type, None if nothing of the type was stored.
+    """
+
+    row = connection.execute("SELECT id FROM device_type WHERE name = ?", (device_type,)).fetchone()
+
+    return None if row is None else row[0]
+
+
+def _query(connection, conditions, parameters):
+    """
+    Select named statuses matching all conditions, ordered by time.
+    """
+
+    sql = SELECT_STATUS
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY s.timestamp, s.device_type_id, s.device_index, f.position"
+
+    return connection.execute(sql, parameters).fetchall()
+
+
+def query_time_range(connection, start, end, device_type=None, intersection=None):
+    """
+    Get all stored values within a time range.
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection to the database.
+    start : float
+        Start timestamp (inclusive).
+    end : float
+        End timestamp (exclusive).
+    device_type : str
+        Message type (key of messagetypes.MESSAGE_TYPE_DICT) to select, if None all types are selected.
+    intersection : str
+        Intersection to select, if None all intersections are selected.
+
+    Returns
+    ----------
+    rows : list
+        Tuples of (intersection, timestamp, device_type, device_index, field, value).
+    """
+
+    conditions = ["s.timestamp >= ?", "s.timestamp < ?"]
+    parameters = [start, end]
+    if device_type is not None:
+        device_type_id = _device_type_id(connection, device_type)
+        if device_type_id is None:
+            return []
+        conditions.append("s.device_type_id = ?")
+        parameters.append(device_type_id)
+    if intersection is not None:
+        conditions.append("s.intersection = ?")
+        parameters.append(intersection)
+
+    return _query(connection, conditions, parameters)
+
+
+def query_device(connection, device_type, device_index, start=None, end=None, intersection=None):
+    """
+    Get the stored values of a single device, optionally within a time range.
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection to the database.
+    device_type : str
+        Message type (key of messagetypes.MESSAGE_TYPE_DICT) of the device.
+    device_index : int
+        Index of the device.
+    start : float
+        Start timestamp (inclusive), if None there is no lower bound.
+    end : float
+        End timestamp (exclusive), if None there is no upper bound.
+    intersection : str
+        Intersection to select, if None all intersections are selected.
+
+    Returns
+    ----------
+    rows : list
+        Tuples of (intersection, timestamp, device_type, device_index, field, value).
+    """
+
+    device_type_id = _device_type_id(connection, device_type)
+    if device_type_id is None:
+        return []
+
+    conditions = ["s.device_type_id = ?", "s.device_index = ?"]
+    parameters = [device_type_id, device_index]
+    if start is not None:
+        conditions.append("s.timestamp >= ?")
+        parameters.append(start)
+    if end is not None:
+        conditions.append("s.timestamp < ?")
+        parameters.append(end)
+    if intersection is not None:
+        conditions.append("s.intersection = ?")
+        parameters.append(intersection)
+
+    return _query(connection, conditions, parameters)
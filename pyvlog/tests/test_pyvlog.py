@@ -1,4 +1,20 @@
-from pyvlog.parsers import VLogParser
+from pyvlog.parsers import VLogParser, VLogParserToList, VLogParserToPipeline, VLogParserToSharedMemory
+from pyvlog.parsers import CompactStatusMixin, VLogParserCompact, VLogParserToSqlite
+from pyvlog.compact import status_to_dict
+from pyvlog.shared import SharedStatusWriter
+from pyvlog.pipeline import SinkPipeline, _SinkQueue
+from pyvlog.merge import merge_messages
+from pyvlog.replay import ParserTarget, Replayer, TcpTarget, find_max_throughput, schedule
+from pyvlog.converters import file_to_intervals, file_to_list, file_to_sqlite, list_to_list
+from pyvlog import sqlite
+import numpy as np
+import socket
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import types
 import ujson
 
 
@@ -22,6 +38,16 @@ def get_value_rec(v_key, v_dict):
     return None
 
 
+def thaw(value):
+    if isinstance(value, types.MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    return value
+
+
+def snapshot_to_json(snapshot):
+    return ujson.dumps(thaw(snapshot))
+
+
 def test_parsing():
 
     # Load the test set of messages
@@ -40,3 +66,391 @@ def test_parsing():
 
     # Check both dictionaries are the same by comparing json strings
     assert ujson.dumps(last_status) == ujson.dumps(vlogger.status), "Converted status does not agree with reference"
+
+
+def test_intervals():
+
+    logged_types = ['detectie', 'externeSignaalgroep', 'interneFaseCyclus']
+    intervals = file_to_intervals("pyvlog/data/test.vlg", logged_types=logged_types)
+    status_list = file_to_list("pyvlog/data/test.vlg", logged_types=logged_types)
+
+    # Every logged device value should agree with the state of the interval covering its timestamp
+    for key in logged_types:
+        df = intervals[key]
+        fields = [c for c in df.columns if c not in ['index', 'start', 'end']]
+        runs = {index: (group['start'].values.astype('int64') / 1000000000, group[fields].values.tolist())
+                for index, group in df.groupby('index')}
+        for status in status_list:
+            for index, value in status[key].items():
+                starts, states = runs[int(index)]
+                run = np.searchsorted(starts, status['timestamp'], side='right') - 1
+                expected = list(value.values()) if isinstance(value, dict) else [value]
+                assert states[run] == expected, "Interval state does not agree with status"
+
+
+def test_pipeline():
+
+    with open("pyvlog/data/test.vlg", "rb") as f:
+        messages = [m.decode("utf-8").strip() for m in f.readlines()]
+    status_list = file_to_list("pyvlog/data/test.vlg")
+
+    # Every status reaches a blocking sink in order
+    piped_list = []
+    with SinkPipeline([piped_list.append], maxsize=4, policy='block') as pipeline:
+        vlogger = VLogParserToPipeline(pipeline)
+        for m in messages:
+            vlogger.parse_message(m)
+    assert [snapshot_to_json(s) for s in piped_list] == [ujson.dumps(s) for s in status_list], \
+        "Piped statuses do not agree with list"
+
+    # Snapshots keep integer device indices and cannot be modified by a sink
+    assert 0 in piped_list[-1]['detectie']
+    try:
+        piped_list[-1]['detectie'][0] = None
+        assert False, "Snapshot could be modified"
+    except TypeError:
+        pass
+    try:
+        piped_list[-1]['detectie'][0]['bezet'] = 99
+        assert False, "Snapshot device could be modified"
+    except TypeError:
+        pass
+
+    # Compact devices are copied, so the parser does not change statuses waiting for a sink
+    class VLogParserToPipelineCompact(CompactStatusMixin, VLogParserToPipeline):
+        packed_status = True
+
+    piped_list = []
+    with SinkPipeline([piped_list.append], maxsize=4, policy='block') as pipeline:
+        vlogger = VLogParserToPipelineCompact(pipeline)
+        for m in messages:
+            vlogger.parse_message(m)
+    assert piped_list[-1]['detectie'] is not vlogger.status['detectie']
+    same = [ujson.dumps(status_to_dict(s)) for s in piped_list] == [ujson.dumps(s) for s in status_list]
+    assert same, "Piped compact statuses do not agree with list"
+
+    # A stalled sink with a dropping policy only keeps the newest statuses
+    for policy in ['drop-oldest', 'coalesce']:
+        release = threading.Event()
+        piped_list = []
+        pipeline = SinkPipeline([lambda s: release.wait() and piped_list.append(s)], maxsize=2, policy=policy)
+        vlogger = VLogParserToPipeline(pipeline)
+        for m in messages:
+            vlogger.parse_message(m)
+        assert pipeline.metrics()[0]['depth'] <= 2
+        release.set()
+        pipeline.close()
+        metrics = pipeline.metrics()[0]
+        assert metrics['processed'] + metrics['dropped'] + metrics['coalesced'] == len(status_list)
+        assert snapshot_to_json(piped_list[-1]) == ujson.dumps(status_list[-1]), "Newest status was not kept"
+
+    # A status blocked on a full queue is not added once the queue closes
+    q = _SinkQueue(1, 'block')
+    assert q.put({})
+    threading.Timer(0.1, q.close).start()
+    assert not q.put({}), "Status was added to a closed queue"
+    assert q.metrics['depth'] == 1
+
+
+def test_sqlite():
+
+    intervals = file_to_intervals("pyvlog/data/test.vlg")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path_to_db = os.path.join(tmp_dir, "test.db")
+        file_to_sqlite("pyvlog/data/test.vlg", path_to_db, intersection="test")
+        connection = sqlite.connect(path_to_db)
+
+        # Each stored change starts an interval of the same state
+        df = intervals['externeSignaalgroep']
+        for index, group in df.groupby('index'):
+            rows = sqlite.query_device(connection, 'externeSignaalgroep', int(index), intersection="test")
+            assert [r[5] for r in rows] == group['state'].tolist(), "Stored changes do not agree with intervals"
+
+        start = df['start'].min().timestamp()
+        rows = sqlite.query_time_range(connection, start, start + 60, device_type='externeSignaalgroep')
+        assert len(rows) == (df['start'] - df['start'].min() < np.timedelta64(60, 's')).sum()
+        connection.close()
+
+        # Instruction variables are events, so every value is stored even if it repeats the previous one
+        path_to_db = os.path.join(tmp_dir, "events.db")
+        file_to_sqlite("pyvlog/data/test.vlg", path_to_db, logged_types=['instructieVariabelen'])
+        events = {s['timestamp']: len(s['instructieVariabelen']) * 5 for s in
+                  file_to_list("pyvlog/data/test.vlg", logged_types=['instructieVariabelen'])
+                  if s['instructieVariabelen']}
+        connection = sqlite.connect(path_to_db)
+        counts = dict(connection.execute("SELECT timestamp, COUNT(*) FROM status_named GROUP BY timestamp").fetchall())
+        assert events.items() <= counts.items(), "Instruction variable events were not all stored"
+        assert sum(counts.values()) >= 700
+        connection.close()
+
+
+def test_cli():
+
+    status_list = file_to_list("pyvlog/data/test.vlg")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path_to_json = os.path.join(tmp_dir, "test.json")
+
+        # JSON conversion should not import pandas
+        code = ("import sys; from pyvlog.cli import main; main(sys.argv[1:]); "
+                "assert 'pandas' not in sys.modules, 'pandas imported'")
+        subprocess.run([sys.executable, "-c", code, "convert", "pyvlog/data/test.vlg", "-o", path_to_json],
+                       check=True)
+
+        # Including the final status, as stored by the other formats
+        vlogger = VLogParser()
+        with open("pyvlog/data/test.vlg", "r") as f:
+            for m in f:
+                vlogger.parse_message(m.strip())
+        with open(path_to_json, "rb") as f:
+            converted = ujson.dumps(ujson.load(f))
+        assert converted == ujson.dumps(status_list + [vlogger.status]), "Converted statuses do not agree with list"
+
+        # Line numbers of the index count empty lines
+        path_to_vlg = os.path.join(tmp_dir, "test.vlg")
+        with open("pyvlog/data/test.vlg", "r") as f:
+            lines = f.readlines()
+        with open(path_to_vlg, "w") as f:
+            f.writelines(["\n"] + lines[:10] + ["\n"] + lines[10:])
+        result = subprocess.run([sys.executable, "-m", "pyvlog.cli", "index", path_to_vlg],
+                                check=True, capture_output=True, text=True)
+        with open(path_to_vlg, "r") as f:
+            references = [i for i, line in enumerate(f, 1) if line[:2] == '01']
+        assert [int(line.split("\t")[1]) for line in result.stdout.splitlines()] == references
+
+        # Binary formats need an output file
+        result = subprocess.run([sys.executable, "-m", "pyvlog.cli", "convert", "-f", "sqlite", path_to_vlg],
+                                capture_output=True, text=True)
+        assert result.returncode == 2 and "needs a file" in result.stderr
+
+
+def test_merge():
+
+    with open("pyvlog/data/test.vlg", "rb") as f:
+        messages = [m.decode("utf-8").strip() for m in f.readlines()]
+
+    # Split at the time references into overlapping parts, given out of order
+    references = [i for i, m in enumerate(messages) if m[:2] == '01']
+    parts = [messages[references[2]:],
+             messages[:references[1] + 200],
+             messages[references[1]:references[2] + 50]]
+
+    merged = list(merge_messages(parts))
+    assert merged == messages, "Merged messages do not agree with original"
+    assert ujson.dumps(list_to_list(merged)) == ujson.dumps(list_to_list(messages))
+
+    # A source starting between time references drops its untimed messages, which the other source covers
+    parts = [messages[references[1] + 500:],
+             messages[:references[2] + 50]]
+    merged = list(merge_messages(parts))
+    assert merged == messages, "Merged messages do not agree with original"
+    assert ujson.dumps(list_to_list(merged)) == ujson.dumps(list_to_list(messages))
+
+    # Sources without a time reference cannot be merged by time, rather than being dropped
+    try:
+        list(merge_messages([messages[1:references[1]], messages[references[1] + 1:references[2]]]))
+        assert False, "Sources without a time reference were merged"
+    except AssertionError as e:
+        assert "no time reference" in str(e)
+
+
+def test_shared_memory():
+
+    with open("pyvlog/data/test.vlg", "rb") as f:
+        messages = [m.decode("utf-8").strip() for m in f.readlines()]
+    logged_types = ['detectie', 'externeSignaalgroep', 'interneFaseCyclus']
+    status_list = list_to_list(messages, logged_types=logged_types)
+
+    writer = SharedStatusWriter({'detectie': 128, 'externeSignaalgroep': 16, 'interneFaseCyclus': 16})
+    try:
+        vlogger = VLogParserToSharedMemory(writer, logged_types=logged_types)
+        for m in messages:
+            vlogger.parse_message(m)
+
+        # A reader in another process sees the last logged status
+        code = ("import sys, ujson; from pyvlog.shared import SharedStatusReader; "
+                "reader = SharedStatusReader(sys.argv[1]); snapshot = reader.read(); "
+                "print(ujson.dumps([snapshot.version, snapshot.values('detectie')[2, 2], snapshot.to_dict()])); "
+                "reader.close()")
+        output = subprocess.run([sys.executable, "-c", code, writer.name], check=True, stdout=subprocess.PIPE).stdout
+        version, bezet, status = ujson.loads(output)
+    finally:
+        writer.close()
+
+    assert version == 2 * len(status_list)
+    assert bezet == status_list[-1]['detectie']['2']['bezet']
+    assert status == status_list[-1], "Shared status does not agree with list"
+
+
+def test_cache():
+
+    with open("pyvlog/data/test.vlg", "rb") as f:
+        messages = [m.decode("utf-8").strip() for m in f.readlines()]
+    status_list = list_to_list(messages, logged_types=[])
+
+    # Cached decoding gives the same statuses, even when the cache is too small for all payloads
+    for cache_size in [16, 4096]:
+        cached_list = []
+        vlogger = VLogParserToList(cached_list, logged_types=[], cache_size=cache_size)
+        for m in messages:
+            vlogger.parse_message(m)
+        assert ujson.dumps(cached_list) == ujson.dumps(status_list), "Cached statuses do not agree with list"
+
+        info = vlogger.cache_info()
+        assert info['size'] <= cache_size
+        assert info['hits'] > 0
+
+    assert VLogParser().cache_info() is None
+
+    # Modifying a logged status does not change the cached values of later statuses
+    class VLogParserToListModifying(VLogParserToList):
+        def log_status(self, status, status_list):
+            super().log_status(status, status_list)
+            if len(status_list) == 100:
+                for value in status['detectie'].values():
+                    value['bezet'] = 77
+
+    modified_lists = []
+    for cache_size in [0, 4096]:
+        modified_lists.append([])
+        vlogger = VLogParserToListModifying(modified_lists[-1], cache_size=cache_size)
+        for m in messages:
+            vlogger.parse_message(m)
+    unchanged = ujson.dumps(modified_lists[1]) == ujson.dumps(modified_lists[0])
+    assert unchanged, "Modified status changed the cache"
+
+
+def test_compact():
+
+    with open("pyvlog/data/test.vlg", "rb") as f:
+        messages = [m.decode("utf-8").strip() for m in f.readlines()]
+
+    # Compact statuses convert back to the reference status
+    vlogger = VLogParserCompact(logged_types=[])
+    for m in messages:
+        vlogger.parse_message(m)
+    with open("pyvlog/data/test.json", "rb") as f:
+        last_status = ujson.load(f)[0]
+    assert ujson.loads(ujson.dumps(status_to_dict(vlogger.status))) == last_status, "Compact status does not agree"
+    assert vlogger.status['detectie'][2]['bezet'] == last_status['detectie']['2']['bezet']
+
+    # Existing sinks receive statuses in the usual format
+    class VLogParserToListCompact(CompactStatusMixin, VLogParserToList):
+        pass
+
+    compact_list = []
+    vlogger = VLogParserToListCompact(compact_list, logged_types=[])
+    for m in messages:
+        vlogger.parse_message(m)
+    assert ujson.dumps(compact_list) == ujson.dumps(list_to_list(messages, logged_types=[]))
+
+    # Statuses in the usual format are packed the same as compact statuses, including the final status
+    class VLogParserToSqliteUnpacked(VLogParserToSqlite):
+        packed_status = False
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rows = []
+        for parser_class in [VLogParserToSqlite, VLogParserToSqliteUnpacked]:
+            path_to_db = os.path.join(tmp_dir, parser_class.__name__ + ".db")
+            vlogger = parser_class(path_to_db, intersection="test", logged_types=["detectie", "instructieVariabelen"])
+            for m in messages:
+                vlogger.parse_message(m)
+            vlogger.close()
+            connection = sqlite.connect(path_to_db)
+            rows.append(connection.execute("SELECT * FROM status_named ORDER BY timestamp, device_type, "
+                                           "device_index, field").fetchall())
+            connection.close()
+        assert rows[0] == rows[1], "Compact statuses stored in SQLite do not agree"
+
+    # The shared memory writer publishes packed statuses directly
+    class VLogParserToSharedMemoryCompact(CompactStatusMixin, VLogParserToSharedMemory):
+        packed_status = True
+
+    blocks = []
+    for parser_class in [VLogParserToSharedMemory, VLogParserToSharedMemoryCompact]:
+        writer = SharedStatusWriter({'detectie': 128, 'externeSignaalgroep': 16, 'interneFaseCyclus': 16})
+        try:
+            vlogger = parser_class(writer, logged_types=['detectie', 'externeSignaalgroep', 'interneFaseCyclus'])
+            for m in messages:
+                vlogger.parse_message(m)
+            blocks.append(bytes(writer.shm.buf[:writer._data_end]))
+        finally:
+            writer.close()
+    assert blocks[0] == blocks[1], "Published compact status does not agree"
+
+
+def test_replay():
+
+    with open("pyvlog/data/test.vlg", "rb") as f:
+        messages = [m.decode("utf-8").strip() for m in f.readlines()]
+    status_list = list_to_list(messages)
+
+    # Replaying into parsers gives the same statuses for every intersection
+    lists = {'a': [], 'b': []}
+    target = ParserTarget({name: VLogParserToList(replayed_list) for name, replayed_list in lists.items()})
+    report = Replayer({'a': messages, 'b': messages}, target, speed=None).run()
+    target.close()
+    assert report['messages'] == 2 * len(messages)
+    assert target.report()['statuses'] == 2 * len(status_list)
+    for replayed_list in lists.values():
+        assert ujson.dumps(replayed_list) == ujson.dumps(status_list), "Replayed statuses do not agree with list"
+
+    # Replaying at speed keeps the original order and emits no message before it is due
+    replayed = []
+    report = Replayer({'a': messages}, lambda name, m: replayed.append(m), speed=100).run(max_duration=0.2)
+    assert 0 < report['messages'] < len(messages)
+    assert replayed == messages[:report['messages']], "Replayed messages are not in order"
+    offsets = [offset for offset, m in schedule(messages)]
+    assert offsets[report['messages'] - 1] / 100 <= report['duration']
+
+    # Runs at increasing speed stop at the first one falling behind
+    def make_parsers(names):
+        return {name: VLogParser() for name in names}
+
+    result = find_max_throughput({'a': messages}, make_parsers, speeds=(1000, 2000), max_latency=10, max_duration=0.2)
+    assert [run['speed'] for run in result['runs']] == [1000, 2000]
+    assert result['sustainedMessagesPerSecond'] == result['runs'][-1]['messagesPerSecond']
+    result = find_max_throughput({'a': messages}, make_parsers, speeds=(1000, 2000), max_latency=0, max_duration=0.2)
+    assert len(result['runs']) == 1 and result['runs'][0]['fallingBehind']
+    assert result['sustainedMessagesPerSecond'] is None
+
+    # Replaying over TCP sends every message
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    received = []
+
+    def receive():
+        connection = server.accept()[0]
+        with connection.makefile('r') as f:
+            received.extend(m.strip() for m in f)
+        connection.close()
+
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+    target = TcpTarget(server.getsockname(), ['a'])
+    Replayer({'a': messages}, target, speed=None).run()
+    target.close()
+    receiver.join()
+    server.close()
+    assert received == messages
+
+    # Parsers logging to a sink may be used from the worker threads and are closed with the target
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path_to_db = os.path.join(tmp_dir, "replay.db")
+        target = ParserTarget({'a': VLogParserToSqlite(path_to_db, changes_only=False)})
+        Replayer({'a': messages}, target, speed=None).run()
+        target.close()
+        connection = sqlite.connect(path_to_db)
+        timestamps = connection.execute("SELECT COUNT(DISTINCT timestamp) FROM status").fetchone()[0]
+        connection.close()
+        assert timestamps == len(status_list) + 1, "Replayed statuses and the final one are not all in the database"
+
+    # The command line replays to a sink, and refuses to interleave several inputs on stdout
+    result = subprocess.run([sys.executable, "-m", "pyvlog.cli", "replay", "-f", "sqlite", "--ramp", "1000",
+                             "--duration", "0.2", "pyvlog/data/test.vlg"], check=True, stdout=subprocess.PIPE)
+    assert ujson.loads(result.stdout)['runs'][0]['statuses'] > 0
+    result = subprocess.run([sys.executable, "-m", "pyvlog.cli", "replay", "--stdout", "pyvlog/data/test.vlg",
+                             "pyvlog/data/test.vlg"], stderr=subprocess.PIPE)
+    assert result.returncode == 2
@@ -3,7 +3,41 @@ Utility functions for converting hex messages and logging statuses.
 """
 
 
-import collections
+from datetime import datetime, timedelta
+import collections.abc
+
+
+def parse_time_reference(message):
+    """
+    Parse the time of a time reference (type 01) message.
+
+    Parameters
+    ----------
+    message : str
+        Time reference message.
+
+    Returns
+    ----------
+    timestamp : float
+        Reference time as a (local time) POSIX timestamp.
+    """
+
+    # Sometimes the time is given as 24:00 not 00:00 so add the time to the date to deal with this
+    timestamp = (
+            datetime(
+                int(message[2:6]),
+                int(message[6:8]),
+                int(message[8:10])
+            )
+            + timedelta(
+                hours=int(message[10:12]),
+                minutes=int(message[12:14]),
+                seconds=int(message[14:16]),
+                milliseconds=int(message[16]) * 100
+            )
+    ).timestamp()
+
+    return timestamp
 
 
 def hex_string_to_bits(string):
@@ -151,6 +185,161 @@ def parse_ovhd_data(string):
     return out_concise
 
 
+def _num_status_devices(payload, data_size):
+    """
+    Number of devices in the payload of a status message.
+
+    Parameters
+    ----------
+    payload : str
+        Status message after the deltaTijd.
+    data_size : float
+        Size of one data item, in hex.
+
+    Returns
+    ----------
+    num_sensors : int
+        Number of sensors in status.
+    """
+
+    num_sensors = int(hex_string_to_bits(payload[:3])[2:], 2)
+
+    assert len(payload[3:]) >= data_size * num_sensors, "Num sensors exceeds message length"
+
+    return num_sensors
+
+
+def _num_update_devices(payload, data_size):
+    """
+    Number of devices in the payload of an update message.
+
+    Parameters
+    ----------
+    payload : str
+        Update message after the deltaTijd.
+    data_size : float
+        Size of one data item, in hex.
+
+    Returns
+    ----------
+    num_sensors : int
+        Number of sensors in update.
+    """
+
+    num_sensors = int(payload[0], 16)
+
+    assert len(payload[1:]) >= data_size * num_sensors, "Num sensors exceeds message length"
+
+    return num_sensors
+
+
+def decode_payload(message_type, payload):
+    """
+    Decode the device values of a status or update message.
+    The result only depends on the arguments, so it can be cached.
+
+    Parameters
+    ----------
+    message_type : int
+        Message code (a device type of messagetypes.MESSAGE_TYPE_DICT, not 1 or 4).
+    payload : str
+        Message after the deltaTijd (from the sixth character on).
+
+    Returns
+    ----------
+    values : tuple
+        Pairs of (device index, value), in message order.
+    """
+
+    values = []
+
+    if message_type == 5:
+        # Detection status
+        num_sensors = _num_status_devices(payload, data_size=1)
+        for i in range(0, num_sensors):
+            values.append((i, parse_detection_data(payload[3 + i])))
+
+    elif message_type == 6:
+        # Detection update
+        num_sensors = _num_update_devices(payload, data_size=4)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 4:3 + i * 4], 16), parse_detection_data(payload[4 + i * 4])))
+
+    elif message_type in [7, 11, 15]:
+        # Other input / output (GUS, WUS) status
+        num_sensors = _num_status_devices(payload, data_size=0.25)
+        status_bits = hex_string_to_bits(payload[3:])
+        for i in range(0, num_sensors):
+            values.append((i, int(status_bits[i], 2)))
+
+    elif message_type in [8, 12, 16]:
+        # Other input / output (GUS, WUS) update
+        num_sensors = _num_update_devices(payload, data_size=2)
+        for i in range(0, num_sensors):
+            status_bits = hex_string_to_bits(payload[1 + i * 2:3 + i * 2])
+            values.append((int(status_bits[:-1], 2), int(status_bits[-1], 2)))
+
+    elif message_type == 9:
+        # Internal phase status
+        num_sensors = _num_status_devices(payload, data_size=3)
+        for i in range(0, num_sensors):
+            values.append((i, parse_internal_data(payload[3 + i * 3:6 + i * 3])))
+
+    elif message_type == 10:
+        # Internal phase update
+        num_sensors = _num_update_devices(payload, data_size=6)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 6:3 + i * 6], 16), parse_internal_data(payload[4 + i * 6:7 + i * 6])))
+
+    elif message_type in [13, 17, 19]:
+        # External phase / desired program / actual program status
+        num_sensors = _num_status_devices(payload, data_size=1)
+        for i in range(0, num_sensors):
+            values.append((i, int(payload[3 + i], 16)))
+
+    elif message_type == 14:
+        # External phase update
+        num_sensors = _num_update_devices(payload, data_size=4)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 4:3 + i * 4], 16), int(payload[3 + i * 4:5 + i * 4], 16)))
+
+    elif message_type in [18, 20]:
+        # Desired / actual program update
+        num_sensors = _num_update_devices(payload, data_size=2)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 2], 16), int(payload[2 + i * 2], 16)))
+
+    elif message_type == 23:
+        # Thermometer status
+        num_sensors = _num_status_devices(payload, data_size=1)
+        for i in range(0, num_sensors):
+            status_bits = hex_string_to_bits(payload[3 + i])
+            values.append((i, {'MVG': int(status_bits[-1], 2),
+                               'RNA': int(status_bits[-2], 2)}))
+
+    elif message_type == 24:
+        # Thermometer update
+        num_sensors = _num_update_devices(payload, data_size=2)
+        for i in range(0, num_sensors):
+            status_bits = hex_string_to_bits(payload[2 + i * 2])
+            values.append((int(payload[1 + i * 2], 16), {'MVG': int(status_bits[-1], 2),
+                                                          'RNA': int(status_bits[-2], 2)}))
+
+    elif message_type == 32:
+        # Instruction variable update
+        num_sensors = _num_update_devices(payload, data_size=4)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 4:3 + i * 4], 16), parse_instruction_data(payload[3 + i * 4:5 + i * 4])))
+
+    elif message_type == 34:
+        # OV/hulpdienst update
+        num_sensors = _num_update_devices(payload, data_size=6)
+        for i in range(0, num_sensors):
+            values.append((int(payload[1 + i * 6:3 + i * 6], 16), parse_ovhd_data(payload[3 + i * 6:7 + i * 6])))
+
+    return tuple(values)
+
+
 def flatten(d, parent_key='', sep='_'):
     """
     Flatten a nested dict.
@@ -172,7 +361,7 @@ def flatten(d, parent_key='', sep='_'):
     items = []
     for k, v in d.items():
         new_key = parent_key + sep + str(k) if parent_key else str(k)
-        if isinstance(v, collections.MutableMapping):
+        if isinstance(v, collections.abc.MutableMapping):
             items.extend(flatten(v, new_key, sep=sep).items())
         else:
             items.append((new_key, v))
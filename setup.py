@@ -18,9 +18,15 @@ setup(
     url="https://github.com/HAL24K/pyvlog",
     packages=find_packages(),
     install_requires=install_requires,
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     test_suite='nose.collector',
     tests_require=['nose>=1.3.7'],
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['pyvlog=pyvlog.cli:main'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3.7",
         "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",